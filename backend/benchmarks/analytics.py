@@ -0,0 +1,36 @@
+"""Время построения аналитического отчета на синтетической базе.
+
+Запуск из каталога backend: python -m benchmarks.analytics [групп] [студентов в группе]
+По умолчанию 400 групп по 25 студентов, 10 дисциплин и 2 сессии — 200 000 оценок.
+"""
+import sys, tempfile, time
+from pathlib import Path
+from database.db import db
+from database.migrations import run_migrations
+from services import analytics
+from benchmarks.data import generate
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label}: {(time.perf_counter() - start) * 1000:.0f} мс")
+    return result
+
+
+def main(groups=400, students_per_group=25):
+    path = Path(tempfile.mkdtemp()) / "bench.db"
+    db.init(str(path))
+    run_migrations()
+    with db.connection_context():
+        print(generate(groups, students_per_group, disciplines=10, sessions=2))
+        frame = timed("загрузка", analytics.load_frame)
+        timed("средний балл и места в группах", analytics.student_ranking, frame)
+        timed("сложность дисциплин", analytics.discipline_difficulty, frame)
+        timed("тренды по сессиям", analytics.session_trends, frame)
+        report = timed("отчет целиком", analytics.build_report)
+    print(f"студентов: {len(report['students'])}, в зоне риска: {len(report['at_risk'])}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,70 @@
+"""Генератор синтетической базы для бенчмарков: группы, студенты, дисциплины, сессии и оценки."""
+import datetime, random
+from database.db import (db, hash_password, normalize_name, Role, User, Disciplines, Teacher, Admin,
+                         Group, Student, SessionPeriod, Grade)
+from services import grade_stats
+
+CHUNK = 5000
+PASSWORD = "123"
+
+
+def _insert(model, rows, fields):
+    for start in range(0, len(rows), CHUNK):
+        model.insert_many(rows[start:start + CHUNK], fields=fields).execute()
+
+
+def generate(groups=50, students_per_group=25, disciplines=10, sessions=2, seed=0):
+    """Заполняет пустую базу, id назначаются явно, чтобы не перечитывать их после вставки.
+
+    Всем пользователям ставится один пароль, хэш считается один раз. Агрегаты GradeStats
+    пересчитываются в конце, как после миграции.
+    Возвращает словарь с количеством созданных записей.
+    """
+    rnd = random.Random(seed)
+    password_hash = hash_password(PASSWORD)
+    today = datetime.date.today()
+    with db.atomic():
+        _insert(Role, [(1, "Студент"), (2, "Преподаватель"), (3, "Сотрудник учебного отдела")],
+                [Role.id, Role.name])
+        _insert(Disciplines, [(i, f"Дисциплина {i}") for i in range(1, disciplines + 1)],
+                [Disciplines.id, Disciplines.name])
+        _insert(Group, [(i, f"Группа {i}") for i in range(1, groups + 1)], [Group.id, Group.name])
+        _insert(SessionPeriod,
+                [(i, f"Сессия {i}", today - datetime.timedelta(days=180 * (sessions - i + 1)),
+                  today - datetime.timedelta(days=180 * (sessions - i)), i == sessions)
+                 for i in range(1, sessions + 1)],
+                [SessionPeriod.id, SessionPeriod.name_session, SessionPeriod.start_date,
+                 SessionPeriod.end_date, SessionPeriod.is_active])
+
+        users = [(1, "Админ", "Админ", "Админ", password_hash, 3)]
+        teachers = []
+        for i in range(1, disciplines + 1):
+            users.append((1 + i, f"Преподаватель{i}", "Имя", "Отчество", password_hash, 2))
+            teachers.append((1 + i, i))
+        first_student = len(users) + 1
+        students = []
+        for group in range(1, groups + 1):
+            for n in range(students_per_group):
+                user_id = first_student + len(students)
+                users.append((user_id, f"Студент{user_id}", f"Имя{n}", f"Отчество{group}", password_hash, 1))
+                students.append((len(students) + 1, user_id, group))
+        # insert_many обходит User.save(), поэтому name_key заполняется здесь
+        users = [(*user, normalize_name(*user[1:4])) for user in users]
+        _insert(User, users, [User.id, User.last_name, User.first_name, User.middle_name,
+                              User.password_hash, User.role, User.name_key])
+        _insert(Admin, [(1,)], [Admin.user])
+        _insert(Teacher, teachers, [Teacher.user, Teacher.discipline])
+        _insert(Student, students, [Student.id, Student.user, Student.group])
+
+        created_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        grades = [
+            (student_id, discipline, session, rnd.choice((2, 3, 4, 4, 5, 5)), 1 + discipline, created_at)
+            for student_id, _, _ in students
+            for session in range(1, sessions + 1)
+            for discipline in range(1, disciplines + 1)
+        ]
+        _insert(Grade, grades, [Grade.student, Grade.discipline, Grade.session, Grade.grade,
+                                Grade.teacher, Grade.created_at])
+        # insert_many обходит инкрементальные агрегаты, поэтому GradeStats считается с нуля
+        grade_stats.recompute()
+    return {"users": len(users), "students": len(students), "grades": len(grades)}
@@ -0,0 +1,57 @@
+"""Сравнение поиска пользователя по ФИО до и после миграции индексов.
+
+Запуск из каталога backend: python -m benchmarks.indexes [количество пользователей]
+"""
+import random, sys, tempfile, time
+from pathlib import Path
+from database.db import db, Role, User
+from database.migrations import SchemaVersion, run_migrations
+
+LOOKUPS = 2000
+
+
+def fill(users):
+    role = Role.create(name="Студент")
+    rows = [(f"Фамилия{i}", f"Имя{i % 500}", f"Отчество{i % 50}", "-", role.id) for i in range(users)]
+    with db.atomic():
+        for start in range(0, len(rows), 5000):
+            User.insert_many(rows[start:start + 5000],
+                             fields=[User.last_name, User.first_name, User.middle_name,
+                                     User.password_hash, User.role]).execute()
+
+
+def drop_new_indexes():
+    for name in ("user_last_name_first_name_middle_name", "grade_session_id_discipline_id",
+                 "sessionperiod_is_active", "sessionperiod_name_session"):
+        db.execute_sql(f'DROP INDEX IF EXISTS "{name}"')
+    SchemaVersion.delete().where(SchemaVersion.version == 2).execute()
+
+
+def measure(users):
+    names = [random.randrange(users) for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for i in names:
+        User.get((User.last_name == f"Фамилия{i}") &
+                 (User.first_name == f"Имя{i % 500}") &
+                 (User.middle_name == f"Отчество{i % 50}"))
+    return (time.perf_counter() - start) / LOOKUPS * 1000
+
+
+def main(users=50_000):
+    path = Path(tempfile.mkdtemp()) / "bench.db"
+    db.init(str(path))
+    run_migrations()
+    with db.connection_context():
+        fill(users)
+        drop_new_indexes()
+        before = measure(users)
+    run_migrations()
+    with db.connection_context():
+        after = measure(users)
+    print(f"Пользователей: {users}, поисков по ФИО: {LOOKUPS}")
+    print(f"без индекса: {before:.3f} мс на запрос")
+    print(f"с индексом:  {after:.3f} мс на запрос ({before / after:.0f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
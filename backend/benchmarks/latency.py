@@ -0,0 +1,72 @@
+"""Задержка /student/my_grades в одиночку и во время тяжелых запросов /administrator/.../all_grades/.
+
+Запуск из каталога backend: python -m benchmarks.latency [групп] [студентов в группе]
+"""
+import asyncio, statistics, sys, tempfile, time
+from pathlib import Path
+import httpx
+from database.db import db
+from database.migrations import run_migrations
+from dependencies.auth_utils import create_jwt_token
+from benchmarks.data import generate
+
+REQUESTS = 300
+HEAVY_WORKERS = 2
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+    return f"p50={pick(0.5):.1f} мс  p95={pick(0.95):.1f} мс  p99={pick(0.99):.1f} мс"
+
+
+async def measure(client, headers):
+    samples = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        response = await client.get("/student/my_grades", headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return samples
+
+
+async def heavy_load(client, headers, stop):
+    done = 0
+    while not stop.is_set():
+        response = await client.get("/administrator/administrator/all_grades/", headers=headers)
+        assert response.status_code == 200, response.text
+        done += 1
+    return done
+
+
+async def run(groups, students_per_group):
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            student = {"Authorization": "Bearer " + await create_jwt_token({"user_id": 12})}
+            admin = {"Authorization": "Bearer " + await create_jwt_token({"user_id": 1})}
+            await measure(client, student)
+            alone = await measure(client, student)
+
+            stop = asyncio.Event()
+            heavy = [asyncio.create_task(heavy_load(client, admin, stop)) for _ in range(HEAVY_WORKERS)]
+            loaded = await measure(client, student)
+            stop.set()
+            exports = sum(await asyncio.gather(*heavy))
+
+    print(f"my_grades без нагрузки:      {percentiles(alone)}")
+    print(f"my_grades во время all_grades: {percentiles(loaded)} (all_grades выполнено: {exports})")
+
+
+def main(groups=100, students_per_group=25):
+    path = Path(tempfile.mkdtemp()) / "bench.db"
+    db.init(str(path))
+    run_migrations()
+    with db.connection_context():
+        print(generate(groups, students_per_group))
+    asyncio.run(run(groups, students_per_group))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
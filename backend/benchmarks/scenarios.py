@@ -0,0 +1,232 @@
+"""Нагрузочные сценарии на синтетической базе: вход, выставление оценок, чтение и выгрузка.
+
+Зависимости бенчмарков (httpx): pip install -r requirements-dev.txt из корня репозитория.
+Запуск из каталога backend:
+    python -m benchmarks.scenarios --groups 100 --students 25 --save before.json
+    python -m benchmarks.scenarios --groups 100 --students 25 --compare before.json
+
+Запросы идут в приложение внутри процесса через httpx.ASGITransport, база — новая
+временная SQLite из benchmarks.data. Для каждого сценария печатаются пропускная
+способность и p50/p95/p99. С --compare результат сравнивается с сохраненным на другом
+коммите; просевшие сценарии помечаются, код выхода 1.
+"""
+import argparse, asyncio, json, random, subprocess, sys, tempfile, time
+from pathlib import Path
+import httpx
+from database.db import db
+from database.migrations import run_migrations
+from dependencies.auth_utils import create_jwt_token
+from benchmarks.data import PASSWORD, generate
+
+ADMIN_ID = 1
+
+
+class Dataset:
+    """Имена и id из benchmarks.data.generate без запросов к базе."""
+
+    def __init__(self, groups, students_per_group, disciplines, sessions):
+        self.groups = groups
+        self.students_per_group = students_per_group
+        self.disciplines = disciplines
+        self.sessions = sessions
+        self.first_student = disciplines + 2
+
+    def group_name(self, group):
+        return f"Группа {group}"
+
+    def student_user_id(self, group, n):
+        return self.first_student + (group - 1) * self.students_per_group + n
+
+    def student_name(self, group, n):
+        user_id = self.student_user_id(group, n)
+        return f"Студент{user_id} Имя{n} Отчество{group}"
+
+    def teacher_user_id(self, discipline):
+        return 1 + discipline
+
+
+async def login(client, data, rnd, tokens):
+    group, n = rnd.randint(1, data.groups), rnd.randrange(data.students_per_group)
+    return await client.post("/token", data={"username": data.student_name(group, n), "password": PASSWORD})
+
+
+async def grade_writes(client, data, rnd, tokens):
+    """Преподаватель выставляет оценки всей группе в активную сессию."""
+    discipline, group = rnd.randint(1, data.disciplines), rnd.randint(1, data.groups)
+    body = {
+        "group_name": data.group_name(group),
+        "students": [data.student_name(group, n) for n in range(data.students_per_group)],
+        "grades": [rnd.randint(2, 5) for _ in range(data.students_per_group)],
+    }
+    return await client.patch(f"/teacher/mass-grades/{data.group_name(group)}", json=body,
+                              headers=tokens[data.teacher_user_id(discipline)])
+
+
+async def dashboard_reads(client, data, rnd, tokens):
+    """Страницы, которые открывают чаще всего: оценки студента, группа у преподавателя, статистика группы."""
+    group = rnd.randint(1, data.groups)
+    kind = rnd.randrange(3)
+    if kind == 0:
+        user_id = data.student_user_id(group, rnd.randrange(data.students_per_group))
+        return await client.get("/student/my_grades", headers=await _token(tokens, user_id))
+    if kind == 1:
+        teacher = data.teacher_user_id(rnd.randint(1, data.disciplines))
+        return await client.get(f"/teacher/grades/{data.group_name(group)}", headers=tokens[teacher])
+    return await client.get(f"/administrator/administrator/stats/{data.group_name(group)}",
+                            headers=tokens[ADMIN_ID])
+
+
+async def exports(client, data, rnd, tokens):
+    """Полная выгрузка оценок; тело читается целиком, как его читал бы клиент."""
+    response = await client.get("/administrator/administrator/export_grades/", headers=tokens[ADMIN_ID])
+    await response.aread()
+    return response
+
+
+SCENARIOS = {
+    "login": login,
+    "grade_writes": grade_writes,
+    "dashboard_reads": dashboard_reads,
+    "exports": exports,
+}
+
+
+async def _token(tokens, user_id):
+    if user_id not in tokens:
+        tokens[user_id] = {"Authorization": "Bearer " + await create_jwt_token({"user_id": user_id},
+                                                                               expires_minutes=24 * 60)}
+    return tokens[user_id]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000 if samples else 0.0
+
+
+async def run_scenario(client, data, tokens, scenario, requests, concurrency, seed):
+    """requests запросов сценария в concurrency параллельных клиентов; задержки и ошибки."""
+    rnd = random.Random(seed)
+    samples, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await scenario(client, data, rnd, tokens)
+            samples.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / elapsed, 2),
+        "p50": round(percentile(samples, 0.5), 2),
+        "p95": round(percentile(samples, 0.95), 2),
+        "p99": round(percentile(samples, 0.99), 2),
+    }
+
+
+async def run(data, names, requests, concurrency, warmup, seed):
+    import main
+    results = dict()
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            tokens = dict()
+            for user_id in [ADMIN_ID, *map(data.teacher_user_id, range(1, data.disciplines + 1))]:
+                await _token(tokens, user_id)
+            for name in names:
+                if warmup:
+                    await run_scenario(client, data, tokens, SCENARIOS[name], warmup, concurrency, seed - 1)
+                results[name] = await run_scenario(client, data, tokens, SCENARIOS[name],
+                                                   requests, concurrency, seed)
+    return results
+
+
+def report(results):
+    print(f"{'сценарий':<16}{'запросов':>9}{'ошибок':>8}{'rps':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['requests']:>9}{result['errors']:>8}{result['rps']:>10.1f}"
+              f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}")
+
+
+def compare(results, baseline, threshold):
+    """Сравнение с сохраненным прогоном; регрессия — p95 вырос или rps упал больше чем на threshold."""
+    print(f"\nсравнение с {baseline.get('commit') or 'сохраненным прогоном'}, порог {threshold:.0%}")
+    if baseline.get("params") != results["params"]:
+        print(f"внимание: параметры прогонов различаются: {baseline.get('params')}")
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        p95 = result["p95"] / base["p95"] - 1 if base["p95"] else 0.0
+        rps = result["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        regressed = p95 > threshold or rps < -threshold or result["errors"] > base["errors"]
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<16} p95 {base['p95']:.1f} -> {result['p95']:.1f} мс ({p95:+.0%})  "
+              f"rps {base['rps']:.1f} -> {result['rps']:.1f} ({rps:+.0%})"
+              f"{'  РЕГРЕССИЯ' if regressed else ''}")
+    return regressions
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочные сценарии на синтетической базе")
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--students", type=int, default=25, help="студентов в группе")
+    parser.add_argument("--disciplines", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"через запятую из: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", type=Path, help="сохранить результат в JSON")
+    parser.add_argument("--compare", type=Path, help="сравнить с сохраненным результатом")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args(argv)
+
+    names = args.scenarios.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+
+    path = Path(tempfile.mkdtemp()) / "bench.db"
+    db.init(str(path))
+    run_migrations()
+    with db.connection_context():
+        print(generate(args.groups, args.students, args.disciplines, args.sessions, args.seed))
+    data = Dataset(args.groups, args.students, args.disciplines, args.sessions)
+    scenarios = asyncio.run(run(data, names, args.requests, args.concurrency, args.warmup, args.seed))
+    report(scenarios)
+
+    params = dict(groups=args.groups, students=args.students, disciplines=args.disciplines,
+                  sessions=args.sessions, requests=args.requests, concurrency=args.concurrency,
+                  seed=args.seed)
+    results = {"commit": current_commit(), "params": params, "scenarios": scenarios}
+    if args.save:
+        args.save.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+import hashlib, json, threading, time
+from collections import OrderedDict
+from config import settings
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей."""
+
+    remote = False
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+
+class RedisCache:
+    """Кэш с интерфейсом TTLCache в Redis, общий для всех процессов uvicorn.
+
+    Значения хранятся в JSON, а не pickle: разбор pickle из Redis выполнил бы код любого,
+    кто может туда писать. Поэтому кладутся только простые данные (словари, списки, числа).
+    Время жизни задает Redis (SET EX), вытеснение - политика maxmemory сервера.
+    Клиент передается снаружи, поэтому подходит и fakeredis.
+    """
+
+    remote = True
+
+    def __init__(self, client, prefix: str, ttl: float):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        data = self.client.get(self.prefix + str(key))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(data)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + str(key), json.dumps(value, ensure_ascii=False), ex=max(1, int(self.ttl)))
+
+    def invalidate(self, key):
+        self.client.delete(self.prefix + str(key))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+class ResponseCache:
+    """LRU-кэш готовых JSON-ответов с бюджетом по памяти и сбросом по тегам.
+
+    Каждая запись помечается тегами (студент, группа, группа+дисциплина), запись оценок
+    сбрасывает только записи с затронутыми тегами. ETag считается от тела ответа.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data = OrderedDict()
+        self._tags = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Возвращает (body, etag) или None."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0], item[1]
+
+    def set(self, key, body: bytes, tags, generation: int):
+        """Сохраняет ответ, если с момента generation ничего не сбрасывалось."""
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        with self._lock:
+            if generation != self.generation or len(body) > self.max_bytes:
+                return etag
+            self._remove(key)
+            self._data[key] = (body, etag, tuple(tags))
+            self.size += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._data)))
+        return etag
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        self.size -= len(item[0])
+        for tag in item[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def respond(self, request, key):
+        """Ответ из кэша: 304, если клиент прислал тот же ETag, иначе тело; None при промахе."""
+        item = self.get(key)
+        if item is None:
+            return None
+        return _response(request, *item)
+
+    def render(self, request, key, content, tags, generation: int):
+        """Сериализует ответ так же, как FastAPI, кэширует его и отдает с ETag."""
+        body = JSONResponse(jsonable_encoder(content)).body
+        return _response(request, body, self.set(key, body, tags, generation))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+def _response(request, body: bytes, etag: str):
+    # no-cache: клиент может хранить ответ, но каждый раз сверяет ETag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def grade_tags(student_id, group_id, discipline_id):
+    """Теги ответов, которые меняются при записи оценки студенту."""
+    return [("student", student_id), ("group", group_id), ("group_discipline", group_id, discipline_id)]
+
+
+def group_member_tags(group_id):
+    """Теги ответов, которые меняются при изменении состава группы."""
+    return [("group", group_id), ("members", group_id)]
+
+
+
+def _redis_key(parts) -> str:
+    return ":".join(str(part) for part in parts)
+
+
+class RedisResponseCache(ResponseCache):
+    """ResponseCache в Redis: записи и теги общие для всех процессов.
+
+    Ответ хранится в хэше (body, etag), для каждого тега - множество ключей ответов.
+    Поколение - счетчик в Redis, запись проверяет его через WATCH, так что ответ,
+    собранный до сброса, не попадает в кэш ни в одном процессе. Сброс публикуется
+    в канал <prefix>invalidate списком тегов в JSON.
+    """
+
+    def __init__(self, client, prefix: str, max_bytes: int, ttl: int):
+        self.client = client
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.channel = prefix + "invalidate"
+        self._generation_key = prefix + "generation"
+
+    @property
+    def generation(self) -> int:
+        return int(self.client.get(self._generation_key) or 0)
+
+    def get(self, key):
+        body, etag = self.client.hmget(self.prefix + "r:" + _redis_key(key), "body", "etag")
+        if body is None or etag is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body, etag.decode()
+
+    def set(self, key, body: bytes, tags, generation: int):
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        if len(body) > self.max_bytes:
+            return etag
+        entry = self.prefix + "r:" + _redis_key(key)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._generation_key)
+                if int(pipe.get(self._generation_key) or 0) != generation:
+                    return etag
+                pipe.multi()
+                pipe.hset(entry, mapping={"body": body, "etag": etag})
+                pipe.expire(entry, self.ttl)
+                for tag in tags:
+                    tag_key = self.prefix + "t:" + _redis_key(tag)
+                    pipe.sadd(tag_key, entry)
+                    pipe.expire(tag_key, self.ttl)
+                pipe.execute()
+            except redis.WatchError:
+                pass
+        return etag
+
+    def invalidate(self, tags):
+        tags = list(tags)
+        # поколение растет до чтения тегов: запись, которая успеет после, будет отброшена
+        self.client.incr(self._generation_key)
+        tag_keys = [self.prefix + "t:" + _redis_key(tag) for tag in tags]
+        if tag_keys:
+            with self.client.pipeline(transaction=False) as pipe:
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                entries = set().union(*pipe.execute())
+            self.client.delete(*entries, *tag_keys)
+        self.client.publish(self.channel, json.dumps(tags))
+
+    def clear(self):
+        self.client.incr(self._generation_key)
+        keys = [key for pattern in ("r:*", "t:*")
+                for key in self.client.scan_iter(match=self.prefix + pattern)]
+        if keys:
+            self.client.delete(*keys)
+        self.client.publish(self.channel, json.dumps(None))
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+def create_redis_client():
+    if redis is None:
+        raise RuntimeError("Для cache_backend=redis нужен пакет redis")
+    return redis.Redis.from_url(settings.redis_url)
+
+
+# кэши по именам; их stats() отдаются в /metrics
+caches = dict()
+
+
+def create_cache(name: str, maxsize: int, ttl: float):
+    """Кэш из settings.cache_backend: memory (в процессе) или redis (общий)."""
+    if settings.cache_backend == "redis":
+        cache = RedisCache(redis_client, f"{settings.cache_prefix}{name}:", ttl)
+    elif settings.cache_backend == "memory":
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    else:
+        raise RuntimeError(f"Неизвестный cache_backend: {settings.cache_backend}")
+    caches[name] = cache
+    return cache
+
+
+def create_response_cache():
+    if settings.cache_backend == "redis":
+        cache = RedisResponseCache(redis_client, f"{settings.cache_prefix}responses:",
+                                   max_bytes=settings.response_cache_bytes,
+                                   ttl=settings.response_cache_ttl)
+    else:
+        cache = ResponseCache(max_bytes=settings.response_cache_bytes)
+    caches["responses"] = cache
+    return cache
+
+
+redis_client = create_redis_client() if settings.cache_backend == "redis" else None
+user_cache = create_cache("users", maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+principal_cache = create_cache("principals", maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+token_version_cache = create_cache("token_versions", maxsize=settings.user_cache_size,
+                                   ttl=settings.user_cache_ttl)
+response_cache = create_response_cache()
@@ -1,9 +1,50 @@
+import os
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     secret_key: str 
     algorithm: str 
     access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 14
+    revocation_sync_seconds: int = 5
+    principal_tokens: bool = False
+    user_cache_ttl: int = 60
+    user_cache_size: int = 1024
+    report_cache_ttl: int = 60
+    response_cache_bytes: int = 32 * 1024 * 1024
+    response_cache_ttl: int = 3600
+    cache_backend: str = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    cache_prefix: str = "session_performance:"
+    metrics_enabled: bool = False
+    slow_request_ms: int = 500
+    slow_request_log: str = ""
+    grade_events_max_connections: int = 10000
+    grade_events_queue_size: int = 100
+    grade_events_keepalive: int = 15
+    grade_events_retry_ms: int = 3000
+    history_compact_after_days: int = 30
+    history_compact_hours: int = 24
+    job_workers: int = 2
+    job_dir: str = ""
+    job_result_ttl_hours: int = 24
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = os.cpu_count() or 1
+    threadpool_size: int = 40
+    db_backend: str = "sqlite"
+    postgres_host: str = "localhost"
+    postgres_port: int = 5432
+    postgres_db: str = "session_performance"
+    postgres_user: str = "postgres"
+    postgres_password: str = ""
+    db_journal_mode: str = "wal"
+    db_synchronous: str = "normal"
+    db_cache_size: int = -64000
+    db_mmap_size: int = 256 * 1024 * 1024
+    db_busy_timeout: int = 5000
+    db_pool_size: int = 48
+    db_pool_timeout: int = 10
+    db_pool_stale_timeout: int = 300
 
     class Config:
         env_file = ".env"
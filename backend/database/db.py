@@ -1,8 +1,158 @@
-import peewee, datetime, bcrypt
+import peewee, datetime, bcrypt, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
+from playhouse.pool import PooledSqliteDatabase, PooledPostgresqlDatabase
+from cache import user_cache, principal_cache, token_version_cache
+from instrumentation import InstrumentedDatabase, timed_hashing, with_request_stats
+from config import settings
 
 DATABASE_PATH = Path(__file__).parent / "db.db"
-db = peewee.SqliteDatabase(str(DATABASE_PATH))
+
+
+class ContextConnectionState(peewee._ConnectionState):
+    """Состояние соединения в contextvars вместо threading.local.
+
+    Все async-эндпоинты выполняются в одном потоке, поэтому с потоковым состоянием
+    конкурентные запросы делили бы одно соединение и одну транзакцию.
+    """
+
+    def __init__(self, **kwargs):
+        super().__setattr__('_state', ContextVar('db_state'))
+        super().__init__(**kwargs)
+
+    def activate(self):
+        """Создает отдельное состояние для текущего контекста (запроса)."""
+        state = dict(closed=True, conn=None, ctx=[], transactions=[])
+        self._state.set(state)
+        return state
+
+    def _current(self):
+        try:
+            return self._state.get()
+        except LookupError:
+            return self.activate()
+
+    def __setattr__(self, name, value):
+        self._current()[name] = value
+
+    def __getattr__(self, name):
+        try:
+            return self._current()[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def get_pragmas():
+    return {
+        'journal_mode': settings.db_journal_mode,
+        'synchronous': settings.db_synchronous,
+        'cache_size': settings.db_cache_size,
+        'mmap_size': settings.db_mmap_size,
+        'busy_timeout': settings.db_busy_timeout,
+    }
+
+
+class SqliteDatabase(InstrumentedDatabase, PooledSqliteDatabase):
+    pass
+
+
+class PostgresqlDatabase(InstrumentedDatabase, PooledPostgresqlDatabase):
+    pass
+
+
+def create_database():
+    """Создает пул соединений для бэкенда из settings.db_backend (sqlite или postgres)."""
+    pool = dict(
+        max_connections=settings.db_pool_size,
+        stale_timeout=settings.db_pool_stale_timeout,
+        timeout=settings.db_pool_timeout,
+    )
+    if settings.db_backend == "postgres":
+        if peewee.psycopg2 is None:
+            raise RuntimeError("Для db_backend=postgres нужен пакет psycopg2-binary")
+        database = PostgresqlDatabase(
+            settings.postgres_db,
+            host=settings.postgres_host,
+            port=settings.postgres_port,
+            user=settings.postgres_user,
+            password=settings.postgres_password,
+            **pool,
+        )
+    elif settings.db_backend == "sqlite":
+        database = SqliteDatabase(
+            str(DATABASE_PATH),
+            pragmas=get_pragmas(),
+            check_same_thread=False,
+            **pool,
+        )
+    else:
+        raise RuntimeError(f"Неизвестный db_backend: {settings.db_backend}")
+    database._state = ContextConnectionState()
+    return database
+
+
+db = create_database()
+
+
+_commit_hooks = ContextVar('commit_hooks', default=None)
+
+
+@contextmanager
+def write_atomic():
+    """Транзакция для эндпоинтов, которые читают и потом пишут.
+
+    В SQLite отложенная транзакция после чтения не может перейти к записи, если
+    кто-то успел записать раньше (database is locked без ожидания), поэтому блокировка
+    записи берется сразу через BEGIN IMMEDIATE и ждет busy_timeout.
+    Функции из on_commit выполняются после коммита внешней транзакции.
+    """
+    if _commit_hooks.get() is not None:
+        with db.atomic():
+            yield
+        return
+    hooks = []
+    token = _commit_hooks.set(hooks)
+    try:
+        with db.atomic('IMMEDIATE') if isinstance(db, peewee.SqliteDatabase) else db.atomic():
+            yield
+    finally:
+        _commit_hooks.reset(token)
+    for hook in hooks:
+        hook()
+
+
+def on_commit(hook):
+    """Откладывает hook до коммита текущей write_atomic; вне ее вызывает сразу.
+
+    Сброс кэшей до коммита дал бы читателю заново закэшировать старые данные.
+    """
+    hooks = _commit_hooks.get()
+    if hooks is None:
+        hook()
+    else:
+        hooks.append(hook)
+
+# bcrypt отпускает GIL, поэтому хэширование в потоках масштабируется по ядрам
+password_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers,
+                                       thread_name_prefix="bcrypt")
+
+
+@timed_hashing
+def hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(rounds=settings.bcrypt_rounds)).decode('utf-8')
+
+
+@timed_hashing
+def verify_password(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def normalize_name(*parts):
+    """Ключ для поиска по ФИО: слова через один пробел, нижний регистр, ё -> е."""
+    return " ".join(" ".join(parts).split()).lower().replace("ё", "е")
 
 
 class BaseModel(peewee.Model):
@@ -20,14 +170,50 @@ class User(BaseModel):
     middle_name = peewee.CharField()
     password_hash = peewee.CharField()
     role = peewee.ForeignKeyField(Role)
+    # растет при смене пароля, токены со старой версией перестают приниматься
+    token_version = peewee.IntegerField(default=0)
+    # нормализованное ФИО, заполняется в save(); по нему работает services.name_index
+    name_key = peewee.CharField(default="", index=True)
+
+    class Meta:
+        indexes = (
+            (('last_name', 'first_name', 'middle_name'), False),
+        )
 
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'),
-                                           bcrypt.gensalt()).decode('utf-8')
+        # синхронные эндпоинты тоже хэшируют в password_executor: его размер
+        # ограничивает число одновременных bcrypt, поток запроса только ждет
+        self.password_hash = password_executor.submit(with_request_stats(hash_password), password).result()
+        self.revoke_tokens()
+
+    def revoke_tokens(self):
+        """Отзывает выданные токены; вызывать при смене пароля, роли или профиля."""
+        self.token_version = (self.token_version or 0) + 1
 
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'),
-                              self.password_hash.encode('utf-8'))
+        return verify_password(password, self.password_hash)
+
+    async def check_password_async(self, password):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, with_request_stats(verify_password),
+                                          password, self.password_hash)
+
+    def save(self, *args, **kwargs):
+        self.name_key = normalize_name(self.last_name, self.first_name, self.middle_name)
+        result = super().save(*args, **kwargs)
+        # внутри write_atomic — после коммита, иначе читатель закэширует старую строку
+        on_commit(self._invalidate_caches)
+        return result
+
+    def delete_instance(self, *args, **kwargs):
+        result = super().delete_instance(*args, **kwargs)
+        on_commit(self._invalidate_caches)
+        return result
+
+    def _invalidate_caches(self):
+        user_cache.invalidate(self.id)
+        principal_cache.invalidate(self.id)
+        token_version_cache.invalidate(self.id)
 
 
 class Disciplines(BaseModel):
@@ -61,7 +247,12 @@ class SessionPeriod(BaseModel):
     name_session = peewee.CharField()
     start_date = peewee.DateField()
     end_date = peewee.DateField()
-    is_active = peewee.BooleanField(default=False)
+    is_active = peewee.BooleanField(default=False, index=True)
+
+    class Meta:
+        indexes = (
+            (('name_session',), False),
+        )
 
 
 class Grade(BaseModel):
@@ -72,14 +263,111 @@ class Grade(BaseModel):
     teacher = peewee.ForeignKeyField(User)
     created_at = peewee.DateTimeField(default=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
+    class Meta:
+        indexes = (
+            (('student', 'discipline', 'session'), True),
+            (('session', 'discipline'), False),
+            (('created_at', 'id'), False),
+        )
+
+
+class GradeStats(BaseModel):
+    """Агрегаты оценок по группе, дисциплине и сессии, обновляются при каждой записи оценки."""
+    group = peewee.ForeignKeyField(Group)
+    discipline = peewee.ForeignKeyField(Disciplines)
+    session = peewee.ForeignKeyField(SessionPeriod)
+    graded = peewee.IntegerField(default=0)
+    grade_sum = peewee.IntegerField(default=0)
+    count_2 = peewee.IntegerField(default=0)
+    count_3 = peewee.IntegerField(default=0)
+    count_4 = peewee.IntegerField(default=0)
+    count_5 = peewee.IntegerField(default=0)
+
+    class Meta:
+        indexes = (
+            (('group', 'discipline', 'session'), True),
+        )
+
+
+class RevokedToken(BaseModel):
+    """Отозванные до истечения срока токены; хранятся, пока токен мог бы быть действителен."""
+    jti = peewee.CharField(unique=True)
+    expires_at = peewee.DateTimeField(index=True)
+
+
+class GradeChange(BaseModel):
+    """Журнал изменений оценок, строки только добавляются.
+
+    id вместо внешних ключей: история переживает удаление дисциплины или студента.
+    Закрытые сессии переносятся в GradeHistoryArchive (services.grade_history.compact).
+    """
+    student_id = peewee.IntegerField()
+    discipline_id = peewee.IntegerField()
+    session_id = peewee.IntegerField()
+    old_grade = peewee.IntegerField(null=True)
+    new_grade = peewee.IntegerField(null=True)
+    changed_by = peewee.IntegerField()
+    source = peewee.CharField()
+    changed_at = peewee.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        indexes = (
+            (('student_id', 'changed_at'), False),
+            (('changed_by', 'changed_at'), False),
+            (('changed_at',), False),
+            (('session_id', 'id'), False),
+        )
+
+
+class GradeHistoryArchive(BaseModel):
+    """Сжатая история оценки закрытой сессии: изменения одного автора одной строкой в JSON."""
+    session_id = peewee.IntegerField()
+    student_id = peewee.IntegerField()
+    discipline_id = peewee.IntegerField()
+    changed_by = peewee.IntegerField()
+    # [[changed_at, old_grade, new_grade, source], ...] по возрастанию времени
+    changes = peewee.TextField()
+    # границы changes, по ним отбор и сортировка по времени идут без разбора JSON
+    first_change = peewee.DateTimeField()
+    last_change = peewee.DateTimeField(index=True)
+
+    class Meta:
+        indexes = (
+            (('session_id', 'student_id', 'discipline_id', 'changed_by'), True),
+            (('student_id', 'last_change'), False),
+            (('changed_by', 'last_change'), False),
+        )
+
+
+class Job(BaseModel):
+    """Фоновая задача администратора; состояние в базе видно всем процессам приложения."""
+    kind = peewee.CharField()
+    status = peewee.CharField(default="queued", index=True)
+    owner = peewee.ForeignKeyField(User)
+    params = peewee.TextField(default="{}")
+    done = peewee.IntegerField(default=0)
+    total = peewee.IntegerField(null=True)
+    message = peewee.TextField(null=True)
+    result_file = peewee.CharField(null=True)
+    media_type = peewee.CharField(null=True)
+    # процесс, в пуле которого выполняется задача
+    pid = peewee.IntegerField(null=True)
+    created_at = peewee.DateTimeField(default=datetime.datetime.now)
+    started_at = peewee.DateTimeField(null=True)
+    finished_at = peewee.DateTimeField(null=True)
+
+
+MODELS = [
+    Role, User, Disciplines, Group,
+    Student, SessionPeriod, Grade, Admin, Teacher, GradeStats, RevokedToken, Job,
+    GradeChange, GradeHistoryArchive
+]
+
 
 def create_tables():
     DATABASE_PATH.parent.mkdir(exist_ok=True)
     with db:
-        db.create_tables([
-            Role, User, Disciplines, Group, 
-            Student, SessionPeriod, Grade,Admin,Teacher
-        ])
+        db.create_tables(MODELS)
 
 
 def create_test():
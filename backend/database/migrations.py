@@ -0,0 +1,97 @@
+import datetime, peewee
+from playhouse.migrate import SchemaMigrator, migrate
+from database.db import db, BaseModel, MODELS, DATABASE_PATH, GradeStats, User, normalize_name
+from services import grade_stats
+
+
+class SchemaVersion(BaseModel):
+    version = peewee.IntegerField(primary_key=True)
+    name = peewee.CharField()
+    applied_at = peewee.DateTimeField(default=datetime.datetime.now)
+
+
+def _add_indexes(migrator, *indexes):
+    # индекс мог уже появиться через create_tables, такие пропускаем
+    operations = []
+    for table, columns, unique in indexes:
+        if not any(index.columns == list(columns) for index in migrator.database.get_indexes(table)):
+            operations.append(migrator.add_index(table, columns, unique))
+    migrate(*operations)
+
+
+def grade_unique_index(migrator):
+    # до уникального индекса оценки могли задвоиться, оставляем последнюю запись
+    migrator.database.execute_sql(
+        'DELETE FROM "grade" WHERE "id" NOT IN ('
+        'SELECT MAX("id") FROM "grade" GROUP BY "student_id", "discipline_id", "session_id")'
+    )
+    _add_indexes(migrator, ('grade', ('student_id', 'discipline_id', 'session_id'), True))
+
+
+def lookup_indexes(migrator):
+    _add_indexes(
+        migrator,
+        ('user', ('last_name', 'first_name', 'middle_name'), False),
+        ('grade', ('session_id', 'discipline_id'), False),
+        ('sessionperiod', ('is_active',), False),
+        ('sessionperiod', ('name_session',), False),
+    )
+
+
+def grade_stats_table(migrator):
+    GradeStats.create_table()
+    grade_stats.recompute()
+
+
+def user_token_version(migrator):
+    migrate(migrator.add_column('user', 'token_version', User.token_version))
+
+
+def user_name_key(migrator):
+    migrate(migrator.add_column('user', 'name_key', User.name_key))
+    rows = User.select(User.id, User.last_name, User.first_name, User.middle_name).tuples()
+    for user_id, *parts in list(rows):
+        User.update(name_key=normalize_name(*parts)).where(User.id == user_id).execute()
+    _add_indexes(migrator, ('user', ('name_key',), False))
+
+
+def grade_created_at_index(migrator):
+    # keyset-страницы по дате: (created_at, id) совпадает с порядком сортировки
+    _add_indexes(migrator, ('grade', ('created_at', 'id'), False))
+
+
+MIGRATIONS = [
+    (1, grade_unique_index),
+    (2, lookup_indexes),
+    (3, grade_stats_table),
+    (4, user_token_version),
+    (5, user_name_key),
+    (6, grade_created_at_index),
+]
+
+
+def run_migrations(database=db):
+    """Применяет недостающие миграции к существующей базе и создает новые таблицы.
+
+    Новая база создается сразу со всеми индексами из моделей, поэтому миграции
+    для нее только отмечаются как примененные.
+    """
+    if isinstance(database, peewee.SqliteDatabase):
+        DATABASE_PATH.parent.mkdir(exist_ok=True)
+    with database.connection_context():
+        existing = database.table_exists('grade')
+        database.create_tables([SchemaVersion])
+        applied = {version for version, in SchemaVersion.select(SchemaVersion.version).tuples()}
+        migrator = SchemaMigrator.from_database(database)
+        for version, migration in MIGRATIONS:
+            if version in applied:
+                continue
+            with database.atomic():
+                if existing:
+                    migration(migrator)
+                SchemaVersion.create(version=version, name=migration.__name__)
+        database.create_tables(MODELS)
+
+
+if __name__ == '__main__':
+    run_migrations()
@@ -1,29 +1,219 @@
-import jwt
+import jwt, uuid
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any
 from config import settings
-from database.db import User
+from database.db import db, User, Role, Student, Teacher, Admin
+from cache import user_cache, principal_cache, token_version_cache
+from models import Principal
+from services.token_revocation import revoked_tokens
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+# версия формата токена с ролью и профилями; токены без "ver" содержат только user_id
+PRINCIPAL_TOKEN_VERSION = 1
+PRINCIPAL_CLAIMS = ("role", "student_id", "group_id", "teacher_id", "discipline_id", "admin_id")
 
 async def create_jwt_token(data: Dict[str, Any], expires_minutes: int = 30) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
-    to_encode.update({"exp": expire})
+    # jti нужен, чтобы отозвать конкретный токен до истечения срока
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
+async def create_refresh_token(user: User) -> str:
+    """Долгоживущий токен для /token/refresh; tv отзывает его вместе с access-токенами."""
+    return await create_jwt_token(data={"user_id": user.id, "type": "refresh", "tv": user.token_version},
+                                  expires_minutes=settings.refresh_token_expire_days * 24 * 60)
+
+def token_claims(user: User) -> Dict[str, Any]:
+    """Данные для токена: user_id и версия токенов или, если включено principal_tokens, весь Principal."""
+    if not settings.principal_tokens:
+        return {"user_id": user.id, "tv": user.token_version}
+    principal = load_principal(user)
+    claims = principal.model_dump(include=set(PRINCIPAL_CLAIMS))
+    claims.update({"user_id": user.id, "ver": PRINCIPAL_TOKEN_VERSION, "tv": user.token_version})
+    return claims
+
+def load_principal(user: User) -> Principal:
+    """Собирает Principal: профиль ищется только в таблице, соответствующей роли."""
+    principal = Principal(id=user.id, role=user.role.name)
+    with db.connection_context():
+        if principal.role == "Студент":
+            row = (Student
+                   .select(Student.id, Student.group)
+                   .where(Student.user == user.id)
+                   .tuples()
+                   .first())
+            if row is not None:
+                principal.student_id, principal.group_id = row
+        elif principal.role == "Преподаватель":
+            # как и Teacher.get(Teacher.user == ...) в роутерах: первая дисциплина преподавателя
+            row = (Teacher
+                   .select(Teacher.id, Teacher.discipline)
+                   .where(Teacher.user == user.id)
+                   .order_by(Teacher.id)
+                   .tuples()
+                   .first())
+            if row is not None:
+                principal.teacher_id, principal.discipline_id = row
+        elif principal.role == "Сотрудник учебного отдела":
+            principal.admin_id = (Admin
+                                  .select(Admin.id)
+                                  .where(Admin.user == user.id)
+                                  .scalar())
+    return principal
+
+def _load_user(user_id) -> User:
+    # соединение не должно оставаться занятым, пока запрос ждет поток для эндпоинта
+    with db.connection_context():
+        return (User
+                .select(User, Role)
+                .join(Role)
+                .where(User.id == user_id)
+                .get())
+
+def _user_data(user: User) -> Dict[str, Any]:
+    # в кэш, в том числе общий в Redis, попадают только поля для эндпоинтов, без password_hash
+    return {"id": user.id, "last_name": user.last_name, "first_name": user.first_name,
+            "middle_name": user.middle_name, "token_version": user.token_version,
+            "role_id": user.role.id, "role": user.role.name}
+
+def _user_from_data(data: Dict[str, Any]) -> User:
+    """User из кэша только для чтения: без password_hash, сохранять его нельзя."""
+    return User(id=data["id"], last_name=data["last_name"], first_name=data["first_name"],
+                middle_name=data["middle_name"], token_version=data["token_version"],
+                role=Role(id=data["role_id"], name=data["role"]))
+
+def _cached_user(user_id) -> User:
+    data = user_cache.get(user_id)
+    if data is not None:
+        return _user_from_data(data)
+    user = _load_user(user_id)
+    user_cache.set(user_id, _user_data(user))
+    return user
+
+def _load_principal(user_id) -> Principal:
+    return load_principal(_cached_user(user_id))
+
+def _cached_principal(user_id) -> Principal:
+    data = principal_cache.get(user_id)
+    if data is not None:
+        return Principal(**data)
+    principal = _load_principal(user_id)
+    principal_cache.set(user_id, principal.model_dump())
+    return principal
+
+def _load_token_version(user_id) -> int:
+    with db.connection_context():
+        version = (User
+                   .select(User.token_version)
+                   .where(User.id == user_id)
+                   .scalar())
+    if version is None:
+        raise User.DoesNotExist
+    return version
+
+def _cached_token_version(user_id) -> int:
+    version = token_version_cache.get(user_id)
+    if version is None:
+        version = _load_token_version(user_id)
+        token_version_cache.set(user_id, version)
+    return version
+
+def _token_version(payload) -> int:
+    # токены, выданные до появления tv в старом формате, соответствуют начальной версии 0
+    return payload.get("tv", 0)
+
+def _decode_token(token: str, token_type: str = "access") -> Dict[str, Any]:
+    payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    user_id = payload.get("user_id")
+    if not int(user_id) or payload.get("type", "access") != token_type:
+        raise HTTPException(status_code=401, detail="Что-то с токеном")
+    if revoked_tokens.is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=401, detail="Токен отозван")
+    return payload
+
+def decode_token(token: str, token_type: str = "access") -> Dict[str, Any]:
+    """Проверенное содержимое токена; ошибки превращаются в 401."""
+    try:
+        return _decode_token(token, token_type)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Токен истек")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Что-то с токеном")
+
 async def verify_jwt_token(token: str) -> User:
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        user_id = payload.get("user_id") 
-        if not int(user_id):
-            raise HTTPException(status_code=401, detail="Что-то с токеном")
-        
-        user = User.get(User.id == user_id)
+        payload = _decode_token(token)
+        user_id = payload["user_id"]
+
+        if user_cache.remote:
+            # общий кэш ходит по сети, поэтому и он опрашивается из пула потоков
+            user = await run_in_threadpool(_cached_user, user_id)
+        else:
+            data = user_cache.get(user_id)
+            if data is not None:
+                user = _user_from_data(data)
+            else:
+                user = await run_in_threadpool(_load_user, user_id)
+                user_cache.set(user_id, _user_data(user))
+        # смена пароля увеличивает token_version, и выданные раньше токены перестают приниматься
+        if user.token_version != _token_version(payload):
+            raise HTTPException(status_code=401, detail="Токен отозван")
         return user
-        
+
     except User.DoesNotExist:
         raise HTTPException(status_code=401, detail="Пользователь не найден")
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Токен истек")
     except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Что-то с токеном")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Что-то с токеном")
+
+async def verify_principal_token(token: str) -> Principal:
+    """Principal из токена; база нужна только при промахе кэша версий токенов.
+
+    Для старых токенов (только user_id) профиль загружается и кэшируется как раньше User.
+    """
+    try:
+        payload = _decode_token(token)
+        user_id = payload["user_id"]
+        # версия проверяется для токенов обоих форматов: иначе смена пароля не отзывала бы старые
+        if token_version_cache.remote:
+            version = await run_in_threadpool(_cached_token_version, user_id)
+        else:
+            version = token_version_cache.get(user_id)
+            if version is None:
+                version = await run_in_threadpool(_load_token_version, user_id)
+                token_version_cache.set(user_id, version)
+        if version != _token_version(payload):
+            raise HTTPException(status_code=401, detail="Токен отозван")
+
+        if payload.get("ver") != PRINCIPAL_TOKEN_VERSION:
+            if principal_cache.remote:
+                return await run_in_threadpool(_cached_principal, user_id)
+            data = principal_cache.get(user_id)
+            if data is not None:
+                return Principal(**data)
+            principal = await run_in_threadpool(_load_principal, user_id)
+            principal_cache.set(user_id, principal.model_dump())
+            return principal
+        return Principal(id=user_id, **{claim: payload.get(claim) for claim in PRINCIPAL_CLAIMS})
+
+    except User.DoesNotExist:
+        raise HTTPException(status_code=401, detail="Пользователь не найден")
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Токен истек")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Что-то с токеном")
+
+async def verify_refresh_token(token: str):
+    """Пользователь и содержимое refresh-токена; bcrypt не нужен, база — только при промахе кэшей."""
+    payload = decode_token(token, "refresh")
+    user_id = payload["user_id"]
+    try:
+        user = await run_in_threadpool(_cached_user, user_id)
+    except User.DoesNotExist:
+        raise HTTPException(status_code=401, detail="Пользователь не найден")
+    if user.token_version != payload.get("tv"):
+        raise HTTPException(status_code=401, detail="Токен отозван")
+    return user, payload
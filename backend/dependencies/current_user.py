@@ -1,10 +1,24 @@
 from typing import Annotated
-from fastapi import Depends
-from dependencies.auth_utils import verify_jwt_token
+from fastapi import Depends, HTTPException
+from dependencies.auth_utils import verify_jwt_token, verify_principal_token
 from database.db import User
+from models import Principal
 from fastapi.security import OAuth2PasswordBearer
 
 OAUTH2_SCHEME = OAuth2PasswordBearer(tokenUrl="token")
+OPTIONAL_OAUTH2_SCHEME = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 async def get_current_user(token: Annotated[str, Depends(OAUTH2_SCHEME)]) -> User:
     return await verify_jwt_token(token)
+
+async def get_current_principal(token: Annotated[str, Depends(OAUTH2_SCHEME)]) -> Principal:
+    return await verify_principal_token(token)
+
+
+async def get_stream_principal(token: Annotated[str | None, Depends(OPTIONAL_OAUTH2_SCHEME)],
+                               access_token: str | None = None) -> Principal:
+    """Как get_current_principal, но токен можно передать и в access_token: EventSource не шлет заголовки."""
+    token = token or access_token
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return await verify_principal_token(token)
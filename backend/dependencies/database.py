@@ -0,0 +1,17 @@
+from database.db import db
+
+
+async def db_connection():
+    """Отдельное состояние соединения на время запроса, соединение возвращается в пул после ответа.
+
+    Соединение берется из пула при первом запросе к базе, то есть уже в потоке
+    синхронного эндпоинта, поэтому ожидание свободного соединения не блокирует event loop.
+    Эндпоинты не держат транзакцию открытой через await: в WAL отложенная
+    транзакция со старым снимком не сможет потом записать.
+    """
+    db._state.activate()
+    try:
+        yield
+    finally:
+        if not db.is_closed():
+            db.close()
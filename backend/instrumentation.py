@@ -0,0 +1,215 @@
+import functools, json, logging, threading, time
+from contextvars import ContextVar
+from cache import caches
+from config import settings
+
+# на запрос в медленном логе сохраняется не больше стольких SQL
+MAX_LOGGED_QUERIES = 200
+
+slow_log = logging.getLogger("session_performance.slow_requests")
+
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Счетчики одного запроса; общий объект виден и из потока синхронного эндпоинта."""
+
+    __slots__ = ('queries', 'query_time', 'hash_count', 'hash_time', 'sql', '_lock')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.hash_count = 0
+        self.hash_time = 0.0
+        self.sql = []
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.query_time += elapsed
+        if len(self.sql) < MAX_LOGGED_QUERIES:
+            # параметры не пишутся: среди них бывают хэши паролей
+            self.sql.append((sql, elapsed))
+
+    def add_hash(self, elapsed):
+        # хэши одного запроса считаются параллельно в password_executor
+        with self._lock:
+            self.hash_count += 1
+            self.hash_time += elapsed
+
+
+class InstrumentedDatabase:
+    """Примесь к классу базы: считает запросы и время в них для текущего запроса.
+
+    Без активного RequestStats (метрики выключены, запуск вне запроса) остается
+    только чтение ContextVar.
+    """
+
+    def execute_sql(self, sql, params=None, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return super().execute_sql(sql, params, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params, *args, **kwargs)
+        finally:
+            stats.add_query(sql, time.perf_counter() - start)
+
+    def execute_many(self, sql, rows):
+        """cursor.executemany одного SQL по всем строкам; в статистике — один запрос."""
+        stats = _current.get()
+        start = time.perf_counter()
+        try:
+            return self.cursor().executemany(sql, rows)
+        finally:
+            if stats is not None:
+                stats.add_query(sql, time.perf_counter() - start)
+
+
+def timed_hashing(func):
+    """Учитывает время bcrypt в RequestStats текущего запроса."""
+    @functools.wraps(func)
+    def wrapper(*args):
+        stats = _current.get()
+        if stats is None:
+            return func(*args)
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats.add_hash(time.perf_counter() - start)
+    return wrapper
+
+
+def with_request_stats(func):
+    """func для пула потоков, который не копирует contextvars: учет идет в RequestStats вызывающего запроса."""
+    stats = _current.get()
+    if stats is None:
+        return func
+
+    def run(*args):
+        token = _current.set(stats)
+        try:
+            return func(*args)
+        finally:
+            _current.reset(token)
+    return run
+
+
+class Metrics:
+    """Суммы по маршрутам для /metrics в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._requests = dict()
+        self._routes = dict()
+        self._slow = 0
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, status, duration, stats: RequestStats, slow):
+        with self._lock:
+            key = (method, route, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            totals = self._routes.setdefault((method, route), [0, 0.0, 0, 0.0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += stats.queries
+            totals[3] += stats.query_time
+            totals[4] += stats.hash_count
+            totals[5] += stats.hash_time
+            self._slow += slow
+
+    def render(self) -> str:
+        with self._lock:
+            requests = dict(self._requests)
+            routes = {key: list(totals) for key, totals in self._routes.items()}
+            slow = self._slow
+        lines = ["# TYPE http_requests_total counter"]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+        series = (
+            ("http_request_duration_seconds_count", "counter", 0),
+            ("http_request_duration_seconds_sum", "counter", 1),
+            ("db_queries_total", "counter", 2),
+            ("db_query_duration_seconds_sum", "counter", 3),
+            ("password_hashes_total", "counter", 4),
+            ("password_hash_duration_seconds_sum", "counter", 5),
+        )
+        for name, kind, index in series:
+            lines.append(f"# TYPE {name} {kind}")
+            for (method, route), totals in sorted(routes.items()):
+                lines.append(f'{name}{{method="{method}",route="{route}"}} {totals[index]:g}')
+        lines.append("# TYPE http_slow_requests_total counter")
+        lines.append(f"http_slow_requests_total {slow}")
+        # попадания и промахи считает каждый процесс для себя, и в Redis-кэшах тоже
+        stats = {name: cache.stats() for name, cache in sorted(caches.items())}
+        for name, key, kind in (("cache_hits_total", "hits", "counter"),
+                                ("cache_misses_total", "misses", "counter"),
+                                ("cache_entries", "size", "gauge")):
+            lines.append(f"# TYPE {name} {kind}")
+            for cache_name, values in stats.items():
+                if key in values:
+                    lines.append(f'{name}{{cache="{cache_name}"}} {values[key]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class InstrumentationMiddleware:
+    """ASGI-middleware: время запроса, SQL и bcrypt по маршрутам, медленные запросы в slow_log.
+
+    Подключается в main.py только при settings.metrics_enabled, поэтому выключенная
+    инструментовка ничего не стоит, кроме проверки ContextVar в execute_sql.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        stream = False
+
+        async def send_wrapper(message):
+            nonlocal status, stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                stream = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                             for name, value in message.get("headers", ()))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            _current.reset(token)
+            # шаблон пути, а не сам путь: иначе метка route росла бы с каждым id и именем
+            route = getattr(scope.get("route"), "path", "unmatched")
+            # поток событий открыт, пока подключен клиент, медленным он не считается
+            slow = not stream and duration * 1000 >= settings.slow_request_ms
+            metrics.observe(scope["method"], route, status, duration, stats, slow)
+            if slow:
+                slow_log.warning(json.dumps({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 1),
+                    "queries": stats.queries,
+                    "query_ms": round(stats.query_time * 1000, 1),
+                    "password_hashes": stats.hash_count,
+                    "password_hash_ms": round(stats.hash_time * 1000, 1),
+                    "sql": [{"sql": sql, "ms": round(elapsed * 1000, 2)} for sql, elapsed in stats.sql],
+                }, ensure_ascii=False))
+
+
+def setup_slow_log():
+    if settings.slow_request_log and not slow_log.handlers:
+        handler = logging.FileHandler(settings.slow_request_log, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_log.addHandler(handler)
+        slow_log.propagate = False
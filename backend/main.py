@@ -1,13 +1,50 @@
-from fastapi import FastAPI
+import asyncio
+from anyio import to_thread
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from models import *
-from routers import students, teachers, admins, admin_teacher, system, users
+from config import settings
+from database.db import db
+from database.migrations import run_migrations
+from instrumentation import InstrumentationMiddleware, setup_slow_log
+from dependencies.database import db_connection
+from services import grade_history, token_revocation
+from services.name_index import name_index
+from services.jobs import job_queue
+from services.grade_events import grade_broker
+from routers import students, teachers, admins, admin_teacher, system, users, jobs, events
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # синхронные эндпоинты и запросы к базе выполняются в этом пуле потоков
+    to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+    run_migrations()
+    token_revocation.revoked_tokens.sync()
+    name_index.load()
+    job_queue.recover()
+    grade_broker.start(asyncio.get_running_loop())
+    tasks = [asyncio.create_task(token_revocation.sync_periodically())]
+    if settings.history_compact_hours:
+        tasks.append(asyncio.create_task(grade_history.compact_periodically()))
+    yield
+    for task in tasks:
+        task.cancel()
+    job_queue.shutdown()
+    db.close_all()
+
+
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(db_connection)])
+if settings.metrics_enabled:
+    # без флага middleware не подключается совсем, запросы идут без лишнего слоя
+    setup_slow_log()
+    app.add_middleware(InstrumentationMiddleware)
 
 app.include_router(students.router)
 app.include_router(teachers.router) 
 app.include_router(admins.router)
 app.include_router(admin_teacher.router)
+app.include_router(jobs.router)
+app.include_router(events.router)
 app.include_router(users.router)
 app.include_router(system.router) 
\ No newline at end of file
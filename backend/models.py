@@ -1,10 +1,41 @@
 from pydantic import BaseModel, Field
-from typing import Annotated
+from datetime import date, datetime
+from typing import Annotated, Literal
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class Principal(BaseModel):
+    """Кто делает запрос: роль и id профилей, достаточные для проверки прав без базы."""
+    id: int
+    role: str
+    student_id: int | None = None
+    group_id: int | None = None
+    teacher_id: int | None = None
+    discipline_id: int | None = None
+    admin_id: int | None = None
+
+
+class JobInfo(BaseModel):
+    """Состояние фоновой задачи для опроса; progress — доля от 0 до 1, если известно total."""
+    id: int
+    kind: str
+    status: str
+    done: int
+    total: int | None = None
+    progress: float | None = None
+    message: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
 
 
 class TeacherOnlyName(BaseModel):
@@ -36,6 +67,16 @@ class StudentCreate(BaseModel):
     group: str
 
 
+class OnboardPerson(BaseModel):
+    last_name: str
+    first_name: str
+    middle_name: str
+    role: Literal["Студент", "Преподаватель"]
+    group: str | None = None
+    discipline: str | None = None
+    password: str | None = None
+
+
 class GradePutRequest(BaseModel):
     last_name: str
     first_name: str
@@ -44,6 +85,8 @@ class GradePutRequest(BaseModel):
     discipline: str
     session: str
     grade: int = Field(..., gt=0,le=5)
+    # выбирает одного из тезок в группе, id — из списка homonyms
+    user_id: int | None = None
 
 
 Grade = Annotated[int, Field(..., ge=2, le=5)]
@@ -52,4 +95,20 @@ Grade = Annotated[int, Field(..., ge=2, le=5)]
 class MassPutGrades(BaseModel):
     group_name : str
     students: list[str] | None = None
-    grades: list[Grade] | None = None
\ No newline at end of file
+    grades: list[Grade] | None = None
+
+
+class GradePage(BaseModel):
+    """Параметры постраничного списка оценок; cursor берется из next_cursor предыдущей страницы."""
+    limit: int = Field(100, ge=1, le=1000)
+    cursor: str | None = None
+    order: Literal["id", "-id", "created_at", "-created_at"] = "id"
+    session: str | None = None
+    discipline: str | None = None
+    teacher: str | None = None
+    date_from: date | None = None
+    date_to: date | None = None
+
+
+class AdminGradePage(GradePage):
+    group: str | None = None
@@ -1,21 +1,42 @@
 from fastapi import APIRouter, Depends, HTTPException
 from database.db import *
-from dependencies.current_user import get_current_user
-from models import GradePutRequest
+from dependencies.current_user import get_current_principal
+from models import GradePutRequest, Principal
+from services import grade_history, grade_stats
+from services.grade_events import grade_broker, grade_messages
+from services.name_index import name_index
+from cache import response_cache, grade_tags
 from typing import Annotated
 from datetime import datetime
 
 router = APIRouter()
 
+
+def _find_student(grade_put: GradePutRequest, group):
+    full_name = f"{grade_put.last_name} {grade_put.first_name} {grade_put.middle_name}"
+    students = name_index.find_all(
+        full_name, lambda entry: (entry.student_id is not None and entry.group_id == group.id and
+                                  grade_put.user_id in (None, entry.user_id)),
+        # одна оценка — один запрос по индексу name_key, зато тезка из другого процесса не пропадет
+        refresh=True)
+    if not students:
+        raise HTTPException(
+            status_code=404,
+            detail="Студент не найден"
+        )
+    if len(students) > 1:
+        # id тезок есть в /administrator/administrator/homonyms
+        raise HTTPException(
+            status_code=400,
+            detail=f"В группе несколько студентов с именем {full_name}, укажите user_id"
+        )
+    return students[0]
+
+
 @router.patch("/put_grade",tags=["Админ/учитель"])
-async def put_grade(current_user: Annotated[User, Depends(get_current_user)], grade_put: GradePutRequest):
-    with db:
-        if current_user.role.name == "Преподаватель":
-            user = User.get(
-                (User.last_name == grade_put.last_name)&
-                (User.first_name == grade_put.first_name)&
-                (User.middle_name == grade_put.middle_name)
-                )
+def put_grade(current_user: Annotated[Principal, Depends(get_current_principal)], grade_put: GradePutRequest):
+    with write_atomic():
+        if current_user.role == "Преподаватель":
             try:
                 group = Group.get(Group.name == grade_put.group)
             except Group.DoesNotExist:
@@ -23,13 +44,7 @@ async def put_grade(current_user: Annotated[User, Depends(get_current_user)], gr
                     status_code=404,
                     detail="Группа не найдена"
                 )
-            try:
-                student = Student.get(Student.user == user, Student.group == group)
-            except Student.DoesNotExist:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Студент не найден"
-                )
+            student = _find_student(grade_put, group)
             
             try:
                 discipline = Disciplines.get(Disciplines.name == grade_put.discipline)
@@ -47,7 +62,7 @@ async def put_grade(current_user: Annotated[User, Depends(get_current_user)], gr
                 )
             try:
                 teacher = Teacher.get(
-                    (Teacher.user == current_user) &  
+                    (Teacher.user == current_user.id) &  
                     (Teacher.discipline == discipline))
             except Teacher.DoesNotExist:
                 raise HTTPException(
@@ -55,33 +70,38 @@ async def put_grade(current_user: Annotated[User, Depends(get_current_user)], gr
                     detail="Преподаватель не найден"
                 )
             grade, created = Grade.get_or_create(
-            student=student,
+            student=student.student_id,
             discipline=discipline,
             session=session,
             defaults={
                'grade': grade_put.grade,
-               'teacher': teacher.user
+               'teacher': current_user.id
             })
                
+            old_grade = None if created else grade.grade
             if not created:
                 grade.grade = grade_put.grade
-                grade.teacher = teacher.user
+                grade.teacher = current_user.id
                 grade.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 grade.save()
+            grade_stats.apply_changes([(group.id, discipline.id, session.id, old_grade, grade_put.grade)])
+            grade_history.record([(student.student_id, discipline.id, session.id, old_grade, grade_put.grade)],
+                                 current_user.id, grade_history.PUT_GRADE)
+            tags = grade_tags(student.student_id, group.id, discipline.id)
+            on_commit(lambda: response_cache.invalidate(tags))
+            messages = grade_messages(group.id, discipline.id, discipline.name, session.name_session,
+                                      [(student.student_id, student.full_name, grade_put.grade)],
+                                      current_user.id)
+            on_commit(lambda: grade_broker.publish(messages))
             return {
                 "message": "Оценка создана" if created else "Оценка обновлена",
-                "student": f"{student.user.last_name} {student.user.first_name} {student.user.middle_name}",
+                "student": student.full_name,
                 "discipline": discipline.name, 
                 "grade": grade_put.grade
                 }
    
-        elif current_user.role.name == "Сотрудник учебного отдела":
+        elif current_user.role == "Сотрудник учебного отдела":
             
-            user = User.get(
-                (User.last_name == grade_put.last_name)&
-                (User.first_name == grade_put.first_name)&
-                (User.middle_name == grade_put.middle_name)
-                )
             try:
                 group = Group.get(Group.name == grade_put.group)
             except Group.DoesNotExist:
@@ -89,13 +109,7 @@ async def put_grade(current_user: Annotated[User, Depends(get_current_user)], gr
                     status_code=404,
                     detail="Группа не найдена"
                 )
-            try:
-                student = Student.get(Student.user == user, Student.group == group)
-            except Student.DoesNotExist:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Студент не найден"
-                )
+            student = _find_student(grade_put, group)
             
             try:
                 discipline = Disciplines.get(Disciplines.name == grade_put.discipline)
@@ -111,31 +125,39 @@ async def put_grade(current_user: Annotated[User, Depends(get_current_user)], gr
                     status_code=404,
                     detail="Сессия не найдена"
                 )
-            try:
-                admin = Admin.get(Admin.user == current_user)
-            except Admin.DoesNotExist:
+            if current_user.admin_id is None:
                 raise HTTPException(
                     status_code=404,
                     detail="Сотрудник учебного отдела не найден"
                 )
             
             grade, created = Grade.get_or_create(
-            student=student,
+            student=student.student_id,
             discipline=discipline,
             session=session,
             defaults={
                'grade': grade_put.grade,
-               'teacher': admin.user
+               'teacher': current_user.id
            })
                 
+            old_grade = None if created else grade.grade
             if not created:
                 grade.grade = grade_put.grade
-                grade.teacher = admin.user
+                grade.teacher = current_user.id
                 grade.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 grade.save()
+            grade_stats.apply_changes([(group.id, discipline.id, session.id, old_grade, grade_put.grade)])
+            grade_history.record([(student.student_id, discipline.id, session.id, old_grade, grade_put.grade)],
+                                 current_user.id, grade_history.PUT_GRADE)
+            tags = grade_tags(student.student_id, group.id, discipline.id)
+            on_commit(lambda: response_cache.invalidate(tags))
+            messages = grade_messages(group.id, discipline.id, discipline.name, session.name_session,
+                                      [(student.student_id, student.full_name, grade_put.grade)],
+                                      current_user.id)
+            on_commit(lambda: grade_broker.publish(messages))
             return {
                 "message": "Оценка создана" if created else "Оценка обновлена",
-                "student": f"{student.user.last_name} {student.user.first_name} {student.user.middle_name}",
+                "student": student.full_name,
                 "discipline": discipline.name, 
                 "grade": grade_put.grade
                 }
@@ -1,53 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from peewee import JOIN
+from typing import Annotated, Literal
+from cache import response_cache, grade_tags, group_member_tags
 from database.db import *
-from dependencies.current_user import get_current_user
-from models import TeacherInfo, StudentCreate
+from datetime import date, datetime, timedelta
+from dependencies.current_user import get_current_principal
+from models import AdminGradePage, Principal, TeacherInfo, StudentCreate, OnboardPerson
+from services import (grade_import, grade_export, grade_history, grade_listing, grade_stats, analytics,
+                      onboarding)
+from services.name_index import name_index
 
 
 router = APIRouter(prefix='/administrator')
 
 @router.post("/create_teacher/",tags=["Админ"])
-async def create_teacher(current_user: Annotated[User, Depends(get_current_user)], teacher: TeacherInfo, discipline_name: str):
-    with db:
-        if current_user.role.name != "Сотрудник учебного отдела":
-            raise HTTPException(
-                status_code=403,
-                detail="Только сотрудники учебного отдела могут добавлять преподавателей",
-            )
-        teacher_role = Role.get(Role.name == "Преподаватель")
+def create_teacher(current_user: Annotated[Principal, Depends(get_current_principal)], teacher: TeacherInfo, discipline_name: str):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="Только сотрудники учебного отдела могут добавлять преподавателей",
+        )
+    teacher_role = Role.get(Role.name == "Преподаватель")
+    full_name = f"{teacher.last_name} {teacher.first_name} {teacher.middle_name}"
+    if name_index.find(full_name, lambda entry: entry.role == teacher_role.name):
+        raise HTTPException(status_code=400,detail="Преподаватель уже есть в базе данных")
+    else:
         try:
-            get_teacher = User.get(
-                (User.last_name == teacher.last_name) &
-                (User.first_name == teacher.first_name) &
-                (User.middle_name == teacher.middle_name) &
-                (User.role == teacher_role)
-            )
-            raise HTTPException(status_code=400,detail="Преподаватель уже есть в базе данных")
-        except User.DoesNotExist:
-            try:
-                discipline = Disciplines.get(Disciplines.name == discipline_name)
-            except Disciplines.DoesNotExist:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Дисциплина не найдены"
-                )
-            new_teacher = User(
-                last_name=teacher.last_name,
-                first_name=teacher.first_name,
-                middle_name=teacher.middle_name,
-                role=teacher_role
+            discipline = Disciplines.get(Disciplines.name == discipline_name)
+        except Disciplines.DoesNotExist:
+            raise HTTPException(
+                status_code=400,
+                detail="Дисциплина не найдены"
             )
-            new_teacher.set_password(teacher.password)
+        new_teacher = User(
+            last_name=teacher.last_name,
+            first_name=teacher.first_name,
+            middle_name=teacher.middle_name,
+            role=teacher_role
+        )
+        new_teacher.set_password(teacher.password)
+        with db.atomic():
             new_teacher.save()
             Teacher.create(user=new_teacher,discipline=discipline)
-            return {'message':f"{new_teacher.last_name} {new_teacher.first_name} {new_teacher.middle_name} теперь преподает {discipline_name}"}
+        name_index.add(new_teacher, teacher_role.name)
+        return {'message':f"{new_teacher.last_name} {new_teacher.first_name} {new_teacher.middle_name} теперь преподает {discipline_name}"}
 
 
 @router.post("/create-group/", tags=["Админ"])
-async def create_group(current_user: Annotated[User, Depends(get_current_user)],group_name: str):
-    with db:
-        if current_user.role.name != "Сотрудник учебного отдела":
+def create_group(current_user: Annotated[Principal, Depends(get_current_principal)],group_name: str):
+    with write_atomic():
+        if current_user.role != "Сотрудник учебного отдела":
             raise HTTPException(
                 status_code=403,
                 detail="У вас недостаточно прав"
@@ -69,54 +72,87 @@ async def create_group(current_user: Annotated[User, Depends(get_current_user)],
 
 
 @router.post("/create-student/", tags=["Админ"])
-async def create_student(current_user: Annotated[User, Depends(get_current_user)], student: StudentCreate):
-    with db:
-        if current_user.role.name != "Сотрудник учебного отдела":
+def create_student(current_user: Annotated[Principal, Depends(get_current_principal)], student: StudentCreate):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас недостаточно прав"
+        )
+    student_role = Role.get(Role.name == "Студент")
+    full_name = f"{student.last_name} {student.first_name} {student.middle_name}"
+    if name_index.find(full_name, lambda entry: entry.role == student_role.name):
+        return {"message": "Студент с такими данными уже существует"}
+    else:
+        try:
+            group = Group.get(Group.name == student.group)
+        except Group.DoesNotExist:
             raise HTTPException(
-                status_code=403,
-                detail="У вас недостаточно прав"
+                status_code=404,
+                detail=f"Группа {student.group} не найдена"
             )
-        student_role = Role.get(Role.name == "Студент")
-        try:
-            student_get = User.get(
-                (User.last_name == student.last_name) &
-                (User.first_name == student.first_name) & 
-                (User.middle_name == student.middle_name) &
-                (User.role == student_role)
+        
+        new_student = User(
+            last_name=student.last_name,
+            first_name=student.first_name,
+            middle_name=student.middle_name,
+            role=student_role
             )
-            return {"message": "Студент с такими данными уже существует"}
-        except User.DoesNotExist:
-            try:
-                group = Group.get(Group.name == student.group)
-            except Group.DoesNotExist:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Группа {student.group} не найдена"
-                )
-            
-            new_student = User(
-                last_name=student.last_name,
-                first_name=student.first_name,
-                middle_name=student.middle_name,
-                role=student_role
-                )
-            new_student.set_password("123")
+        new_student.set_password("123")
+        with db.atomic():
             new_student.save()
+            profile = Student.create(user=new_student,group=group)
+        name_index.add(new_student, student_role.name, profile.id, group.id)
+        response_cache.invalidate(group_member_tags(group.id))
+        return {"message":"Студент успешно создан"}
+
+    
+def _onboarding_answer(created, results):
+    return {
+        "message": f"Создано {created} пользователей, ошибок: {sum(1 for result in results if 'Ошибка' in result)}",
+        "created_count": created,
+        "results": results
+    }
+
+
+@router.post("/onboard/", tags=["Админ"])
+def onboard(current_user: Annotated[Principal, Depends(get_current_principal)], people: list[OnboardPerson]):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас недостаточно прав"
+        )
+    created, results = onboarding.onboard(
+        (number, person.model_dump()) for number, person in enumerate(people, start=1))
+    return _onboarding_answer(created, results)
+
+
+@router.post("/onboard_csv/", tags=["Админ"])
+def onboard_csv(current_user: Annotated[Principal, Depends(get_current_principal)], file: UploadFile):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас недостаточно прав"
+        )
+    try:
+        created, results = onboarding.onboard(onboarding.read_people(file.file))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не удалось прочитать файл: {e}"
+        )
+    return _onboarding_answer(created, results)
 
-            Student.create(user=new_student,group=group)
-            return {"message":"Студент успешно создан"}
 
-        
 @router.post("/fill_discipline/", tags=["Админ"])
-async def fill_name_discipline(current_user: Annotated[User, Depends(get_current_user)],name_disciplines: list[str]):
+def fill_name_discipline(current_user: Annotated[Principal, Depends(get_current_principal)],name_disciplines: list[str]):
     if not name_disciplines:
         raise HTTPException(
             status_code=400,
             detail="Пожалуйста введите хотябы одну дисциплину"
         )
     
-    with db:
-        if current_user.role.name != "Сотрудник учебного отдела":
+    with write_atomic():
+        if current_user.role != "Сотрудник учебного отдела":
             raise HTTPException(
                 status_code=403,
                 detail="У вас нет прав((("
@@ -138,29 +174,47 @@ async def fill_name_discipline(current_user: Annotated[User, Depends(get_current
 
 
 @router.get("/administrator/all_grades/", tags={"Админ"})
-async def grades_all_group(current_user: Annotated[User, Depends(get_current_user)]):
-    with db:
-        if current_user.role.name == "Сотрудник учебного отдела":
+def grades_all_group(current_user: Annotated[Principal, Depends(get_current_principal)]):
+    with db.atomic():
+        if current_user.role == "Сотрудник учебного отдела":
+            rows = (Group
+                    .select(Group.name, Student.id, User.last_name, User.first_name,
+                            User.middle_name, Grade.id, Disciplines.name, Grade.grade)
+                    .join(Student, JOIN.LEFT_OUTER)
+                    .join(User, JOIN.LEFT_OUTER)
+                    .switch(Student)
+                    .join(Grade, JOIN.LEFT_OUTER)
+                    .join(Disciplines, JOIN.LEFT_OUTER)
+                    .order_by(Group.id, Student.id, Grade.id)
+                    .tuples())
+
             answer = []
-            groups = Group.select()
-            for group in groups:
-                students = Student.select().join(Group).where(Group.name == group.name)
-                student_grades = dict()
-                student_grades["Группа"] = group.name
-                student_grades["Информация"] = []
-                for student in students:
-                    grades = Grade.select().where(Grade.student == student)
+            groups = dict()
+            students = dict()
+            for (group_name, student_id, last_name, first_name, middle_name,
+                 grade_id, discipline_name, grade_value) in rows:
+                if group_name not in groups:
+                    student_grades = dict()
+                    student_grades["Группа"] = group_name
+                    student_grades["Информация"] = []
+                    groups[group_name] = student_grades
+                    answer.append(student_grades)
+                if student_id is None:
+                    continue
+                if student_id not in students:
                     info_student = dict()
-                    info_student["Студент"] = f"{student.user.last_name} {student.user.first_name} {student.user.middle_name}"
+                    info_student["Студент"] = f"{last_name} {first_name} {middle_name}"
                     info_student["Оценки"] = []
-                    for grade in grades:
-                        grade_student = dict()
-                        grade_student["Дисциплина"] = grade.discipline.name
-                        grade_student["Оценка"] = grade.grade
-                        info_student["Оценки"].append(grade_student)
-                    student_grades["Информация"].append(info_student)
-                answer.append(student_grades)
-            return answer
+                    students[student_id] = info_student
+                    groups[group_name]["Информация"].append(info_student)
+                if grade_id is None:
+                    continue
+                grade_student = dict()
+                grade_student["Дисциплина"] = discipline_name
+                grade_student["Оценка"] = grade_value
+                students[student_id]["Оценки"].append(grade_student)
+            # сериализуется здесь, в потоке эндпоинта, а не в event loop через jsonable_encoder
+            return JSONResponse(answer)
         else:
             raise HTTPException(
                 status_code=403,
@@ -169,14 +223,21 @@ async def grades_all_group(current_user: Annotated[User, Depends(get_current_use
 
 
 @router.get("/administrator/grades/{group_name}", tags=["Админ"],)
-async def grade_group(current_user: Annotated[User, Depends(get_current_user)], group_name: str):
-    with db:
-        if current_user.role.name != "Сотрудник учебного отдела":
-            raise HTTPException(
-                status_code=403,
-                detail="У вас нет прав для просмотра оценок группы"
-            )
-            
+def grade_group(current_user: Annotated[Principal, Depends(get_current_principal)], group_name: str,
+                request: Request):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для просмотра оценок группы"
+        )
+    # ответ одинаков для всех сотрудников, поэтому ключ без пользователя
+    key = ("admin_grades", group_name)
+    cached = response_cache.respond(request, key)
+    if cached is not None:
+        return cached
+    generation = response_cache.generation
+
+    with db.atomic():
         try:
             group = Group.get(Group.name == group_name)
         except Group.DoesNotExist:
@@ -185,35 +246,267 @@ async def grade_group(current_user: Annotated[User, Depends(get_current_user)],
                 detail=f"Группа {group_name} не найдена"
             )
             
-        students = Student.select().join(Group).where(Group.name == group_name)
-            
-        if not students:
-            return {"message": "В группе нет студентов"}
-          
+        teacher_user = User.alias()
+        rows = (Student
+                .select(Student.id, User.last_name, User.first_name, User.middle_name,
+                        Grade.id, Disciplines.name, Grade.grade, teacher_user.last_name,
+                        teacher_user.first_name, teacher_user.middle_name, Grade.created_at)
+                .join(User)
+                .switch(Student)
+                .join(Grade, JOIN.LEFT_OUTER)
+                .join(Disciplines, JOIN.LEFT_OUTER)
+                .switch(Grade)
+                .join(teacher_user, JOIN.LEFT_OUTER, on=(Grade.teacher == teacher_user.id))
+                .where(Student.group == group)
+                .order_by(Student.id, Grade.id)
+                .tuples())
+
         answer = []
-        for student in students:
-            grades = Grade.select().where(Grade.student == student)
-            info_student = dict()
-            info_student["Студент"] = f"{student.user.last_name} {student.user.first_name} {student.user.middle_name}"
-            info_student["Оценки"] = []
-            for grade in grades:
-                grade_student = dict()
-                grade_student["Дисциплина"] = grade.discipline.name
-                grade_student["Оценка"] = grade.grade
-                grade_student["Преподаватель"] = f"{grade.teacher.last_name} {grade.teacher.first_name} {grade.teacher.middle_name}"
-                grade_student["Дата"] = grade.created_at
-                info_student["Оценки"].append(grade_student)
-            answer.append(info_student)
-        return answer
+        students = dict()
+        for (student_id, last_name, first_name, middle_name, grade_id, discipline_name,
+             grade_value, teacher_last_name, teacher_first_name, teacher_middle_name,
+             created_at) in rows:
+            if student_id not in students:
+                info_student = dict()
+                info_student["Студент"] = f"{last_name} {first_name} {middle_name}"
+                info_student["Оценки"] = []
+                students[student_id] = info_student
+                answer.append(info_student)
+            if grade_id is None:
+                continue
+            grade_student = dict()
+            grade_student["Дисциплина"] = discipline_name
+            grade_student["Оценка"] = grade_value
+            grade_student["Преподаватель"] = f"{teacher_last_name} {teacher_first_name} {teacher_middle_name}"
+            grade_student["Дата"] = created_at
+            students[student_id]["Оценки"].append(grade_student)
+
+        if not answer:
+            answer = {"message": "В группе нет студентов"}
+        return response_cache.render(request, key, answer, [("group", group.id)], generation)
+
+
+@router.get("/administrator/grades_page/", tags=["Админ"])
+def grades_page(current_user: Annotated[Principal, Depends(get_current_principal)],
+                page: Annotated[AdminGradePage, Query()]):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для просмотра оценок"
+        )
+    group_id = None
+    if page.group is not None:
+        try:
+            group_id = Group.get(Group.name == page.group).id
+        except Group.DoesNotExist:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Группа {page.group} не найдена"
+            )
+    try:
+        return grade_listing.list_grades(page, group=group_id)
+    except grade_listing.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/administrator/stats/{group_name}", tags=["Админ"])
+def group_stats(current_user: Annotated[Principal, Depends(get_current_principal)], group_name: str,
+                discipline: str | None = None, session: str | None = None):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для просмотра статистики"
+        )
+    try:
+        group = Group.get(Group.name == group_name)
+    except Group.DoesNotExist:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Группа {group_name} не найдена"
+        )
+    students_count = Student.select().where(Student.group == group).count()
+
+    rows = (GradeStats
+            .select(GradeStats, Disciplines.name, SessionPeriod.name_session)
+            .join(Disciplines)
+            .switch(GradeStats)
+            .join(SessionPeriod)
+            .where(GradeStats.group == group)
+            .order_by(SessionPeriod.id, Disciplines.id))
+    if discipline is not None:
+        rows = rows.where(Disciplines.name == discipline)
+    if session is not None:
+        rows = rows.where(SessionPeriod.name_session == session)
+
+    answer = []
+    for stats in rows:
+        info = dict()
+        info["Дисциплина"] = stats.discipline.name
+        info["Сессия"] = stats.session.name_session
+        info["Студентов"] = students_count
+        info["Оценок"] = stats.graded
+        info["Средний балл"] = round(stats.grade_sum / stats.graded, 2) if stats.graded else None
+        info["Распределение"] = {str(value): getattr(stats, f"count_{value}") for value in grade_stats.BUCKETS}
+        info["Доля без оценки"] = round(max(students_count - stats.graded, 0) / students_count, 4) if students_count else None
+        answer.append(info)
+    return answer
+
+
+def _admin_report(current_user, session):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для просмотра отчетов"
+        )
+    return analytics.get_report(session)
+
+
+@router.get("/administrator/reports/students", tags=["Админ"])
+def report_students(current_user: Annotated[Principal, Depends(get_current_principal)],
+                    group: str | None = None, session: str | None = None):
+    students = _admin_report(current_user, session)["students"]
+    return [student for student in students if group is None or student["Группа"] == group]
+
+
+@router.get("/administrator/reports/at_risk", tags=["Админ"])
+def report_at_risk(current_user: Annotated[Principal, Depends(get_current_principal)],
+                   group: str | None = None, session: str | None = None):
+    students = _admin_report(current_user, session)["at_risk"]
+    return [student for student in students if group is None or student["Группа"] == group]
+
+
+@router.get("/administrator/reports/disciplines", tags=["Админ"])
+def report_disciplines(current_user: Annotated[Principal, Depends(get_current_principal)], session: str | None = None):
+    return _admin_report(current_user, session)["disciplines"]
+
+
+@router.get("/administrator/reports/trends", tags=["Админ"])
+def report_trends(current_user: Annotated[Principal, Depends(get_current_principal)]):
+    return _admin_report(current_user, None)["trends"]
+
+
+@router.get("/administrator/homonyms", tags=["Админ"])
+def homonyms(current_user: Annotated[Principal, Depends(get_current_principal)]):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав"
+        )
+    groups = dict(Group.select(Group.id, Group.name).tuples())
+    answer = []
+    for entries in name_index.homonyms().values():
+        info = dict()
+        info["ФИО"] = entries[0].full_name
+        info["Пользователи"] = [{"id": entry.user_id, "Роль": entry.role, "Группа": groups.get(entry.group_id)}
+                                for entry in entries]
+        answer.append(info)
+    return answer
+
+
+@router.get("/administrator/grade_history", tags=["Админ"])
+def grade_history_list(current_user: Annotated[Principal, Depends(get_current_principal)],
+                       student: str | None = None,
+                       changed_by: str | None = None,
+                       session: str | None = None,
+                       date_from: date | None = None,
+                       date_to: date | None = None,
+                       limit: int = Query(100, ge=1, le=1000)):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для просмотра истории оценок"
+        )
+    # у тезок история показывается вместе
+    student_ids = None
+    if student is not None:
+        student_ids = [entry.student_id for entry in name_index.lookup(student) if entry.student_id is not None]
+    user_ids = None
+    if changed_by is not None:
+        user_ids = [entry.user_id for entry in name_index.lookup(changed_by)]
+    session_id = None
+    if session is not None:
+        session_id = SessionPeriod.select(SessionPeriod.id).where(SessionPeriod.name_session == session).scalar()
+        if session_id is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Сессия не найдена"
+            )
+    return grade_history.history(
+        student_ids, user_ids,
+        date_from=datetime.combine(date_from, datetime.min.time()) if date_from else None,
+        date_to=datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None,
+        session_id=session_id, limit=limit)
+
+
+@router.post("/administrator/import_grades/", tags=["Админ"])
+def import_grades_csv(current_user: Annotated[Principal, Depends(get_current_principal)], file: UploadFile):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для импорта оценок"
+        )
+    try:
+        imported, errors = grade_import.import_grades(file.file, current_user.id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не удалось прочитать файл: {e}"
+        )
+    return {
+        "message": f"Импортировано {imported} оценок, ошибок: {len(errors)}",
+        "imported_count": imported,
+        "errors": errors
+    }
+
+
+@router.get("/administrator/export_grades/", tags=["Админ"])
+async def export_grades(current_user: Annotated[Principal, Depends(get_current_principal)],
+                        format: Literal["csv", "ndjson"] = "csv",
+                        group: str | None = None,
+                        session: str | None = None,
+                        discipline: str | None = None):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для выгрузки оценок"
+        )
+    filters = dict(group=group, session=session, discipline=discipline)
+    if format == "ndjson":
+        return StreamingResponse(grade_export.export_ndjson(**filters),
+                                 media_type="application/x-ndjson")
+    return StreamingResponse(grade_export.export_csv(**filters),
+                             media_type="text/csv; charset=utf-8",
+                             headers={"Content-Disposition": 'attachment; filename="grades.csv"'})
 
 
 @router.delete("/administrator/delete/{discipline}",tags=["Админ"])
-async def delete_discipline(current_user: Annotated[User, Depends(get_current_user)], discipline: str):
-    with db:
-        if current_user.role.name == "Сотрудник учебного отдела":
+def delete_discipline(current_user: Annotated[Principal, Depends(get_current_principal)], discipline: str):
+    with write_atomic():
+        if current_user.role == "Сотрудник учебного отдела":
             try: 
                 discipline_for_delete = Disciplines.get(Disciplines.name == discipline)
             except Disciplines.DoesNotExist:
                 raise HTTPException(status_code=400,detail="Не удалось получить дисциплину из таблицы")
+            tags = {("discipline", discipline_for_delete.id)}
+            deleted = []
+            for student_id, group_id, session_id, grade in (Grade
+                                                            .select(Grade.student, Student.group,
+                                                                    Grade.session, Grade.grade)
+                                                            .join(Student)
+                                                            .where(Grade.discipline == discipline_for_delete)
+                                                            .tuples()):
+                tags.update(grade_tags(student_id, group_id, discipline_for_delete.id))
+                deleted.append((student_id, discipline_for_delete.id, session_id, grade, None))
+            # удаленные оценки попадают в журнал со "Стало" = None, как и любое другое изменение
+            grade_history.record(deleted, current_user.id, grade_history.DELETE_DISCIPLINE)
+            # в PostgreSQL внешние ключи не дали бы удалить дисциплину с оценками и преподавателями;
+            # у преподавателей в токенах discipline_id, поэтому их токены отзываются
+            for teacher_user in User.select().join(Teacher).where(Teacher.discipline == discipline_for_delete):
+                teacher_user.revoke_tokens()
+                teacher_user.save()
+            Teacher.delete().where(Teacher.discipline == discipline_for_delete).execute()
+            Grade.delete().where(Grade.discipline == discipline_for_delete).execute()
+            GradeStats.delete().where(GradeStats.discipline == discipline_for_delete).execute()
             discipline_for_delete.delete_instance()
+            on_commit(lambda: response_cache.invalidate(tags))
             return {"message":f"{discipline} была успешно удалена"}
\ No newline at end of file
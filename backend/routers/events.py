@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Annotated
+from config import settings
+from database.db import db, Group, Disciplines
+from dependencies.current_user import get_stream_principal
+from models import Principal
+from services.grade_events import grade_broker, student_topic, group_topic
+
+
+router = APIRouter(prefix='/events')
+
+
+def _lookup(group_name, discipline_name):
+    # соединение не держится открытым все время, пока висит поток событий
+    with db.connection_context():
+        group_id = Group.select(Group.id).where(Group.name == group_name).scalar()
+        discipline_id = None
+        if discipline_name is not None:
+            discipline_id = Disciplines.select(Disciplines.id).where(Disciplines.name == discipline_name).scalar()
+    return group_id, discipline_id
+
+
+async def _topics(current_user: Principal, group, discipline):
+    if current_user.role == "Студент":
+        if current_user.student_id is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Профиль студента не найден"
+            )
+        return [student_topic(current_user.student_id)]
+    if current_user.role not in ("Преподаватель", "Сотрудник учебного отдела"):
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав"
+        )
+    if group is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Укажите группу"
+        )
+    if current_user.role == "Преподаватель":
+        if current_user.discipline_id is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Пока что вы ничего не преподаете "
+            )
+        # преподаватель видит только свою дисциплину
+        discipline = None
+    group_id, discipline_id = await run_in_threadpool(_lookup, group, discipline)
+    if group_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Группа {group} не найдена"
+        )
+    if discipline is not None and discipline_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Дисциплина не найдена"
+        )
+    if current_user.role == "Преподаватель":
+        discipline_id = current_user.discipline_id
+    return [group_topic(group_id, discipline_id)]
+
+
+@router.get("/grades", tags=["События"])
+async def grade_events(current_user: Annotated[Principal, Depends(get_stream_principal)],
+                       group: str | None = None,
+                       discipline: str | None = None):
+    """Изменения оценок (event: grades); после event: resync клиент перечитывает оценки целиком."""
+    topics = await _topics(current_user, group, discipline)
+    if grade_broker.connections >= settings.grade_events_max_connections:
+        raise HTTPException(
+            status_code=503,
+            detail="Слишком много подписок, попробуйте позже"
+        )
+    return StreamingResponse(grade_broker.stream(topics), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
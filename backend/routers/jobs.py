@@ -0,0 +1,117 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from fastapi.responses import FileResponse
+from pathlib import Path
+from typing import Annotated, Literal
+from database.db import Job
+from dependencies.current_user import get_current_principal
+from models import JobInfo, Principal
+from services.jobs import job_queue
+
+
+router = APIRouter(prefix='/administrator/jobs')
+
+
+def _check_admin(current_user):
+    if current_user.role != "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=403,
+            detail="У вас нет прав для фоновых задач"
+        )
+
+
+def _get_job(job_id) -> Job:
+    try:
+        return Job.get_by_id(job_id)
+    except Job.DoesNotExist:
+        raise HTTPException(
+            status_code=404,
+            detail="Задача не найдена"
+        )
+
+
+def _info(job: Job) -> JobInfo:
+    progress = None
+    if job.total:
+        progress = round(min(job.done / job.total, 1.0), 4)
+    elif job.status == "done":
+        progress = 1.0
+    return JobInfo(id=job.id, kind=job.kind, status=job.status, done=job.done, total=job.total,
+                   progress=progress, message=job.message, created_at=job.created_at,
+                   started_at=job.started_at, finished_at=job.finished_at)
+
+
+@router.post("/export", response_model=JobInfo, tags=["Фоновые задачи"])
+def submit_export(current_user: Annotated[Principal, Depends(get_current_principal)],
+                  format: Literal["csv", "ndjson"] = "csv",
+                  group: str | None = None,
+                  session: str | None = None,
+                  discipline: str | None = None):
+    _check_admin(current_user)
+    params = dict(format=format, group=group, session=session, discipline=discipline)
+    return _info(job_queue.submit("export", current_user.id, params))
+
+
+@router.post("/import_grades", response_model=JobInfo, tags=["Фоновые задачи"])
+def submit_import(current_user: Annotated[Principal, Depends(get_current_principal)], file: UploadFile):
+    _check_admin(current_user)
+    return _info(job_queue.submit("import_grades", current_user.id, dict(teacher_id=current_user.id), file.file))
+
+
+@router.post("/onboard", response_model=JobInfo, tags=["Фоновые задачи"])
+def submit_onboard(current_user: Annotated[Principal, Depends(get_current_principal)], file: UploadFile):
+    _check_admin(current_user)
+    return _info(job_queue.submit("onboard", current_user.id, dict(), file.file))
+
+
+@router.post("/report", response_model=JobInfo, tags=["Фоновые задачи"])
+def submit_report(current_user: Annotated[Principal, Depends(get_current_principal)], session: str | None = None):
+    _check_admin(current_user)
+    return _info(job_queue.submit("report", current_user.id, dict(session=session)))
+
+
+@router.post("/compact_history", response_model=JobInfo, tags=["Фоновые задачи"])
+def submit_compact_history(current_user: Annotated[Principal, Depends(get_current_principal)]):
+    _check_admin(current_user)
+    return _info(job_queue.submit("compact_history", current_user.id, dict()))
+
+
+@router.get("/", response_model=list[JobInfo], tags=["Фоновые задачи"])
+def list_jobs(current_user: Annotated[Principal, Depends(get_current_principal)], limit: int = 50):
+    _check_admin(current_user)
+    return [_info(job) for job in Job.select().order_by(Job.id.desc()).limit(min(limit, 500))]
+
+
+@router.get("/{job_id}", response_model=JobInfo, tags=["Фоновые задачи"])
+def get_job(current_user: Annotated[Principal, Depends(get_current_principal)], job_id: int):
+    _check_admin(current_user)
+    return _info(_get_job(job_id))
+
+
+@router.post("/{job_id}/cancel", response_model=JobInfo, tags=["Фоновые задачи"])
+def cancel_job(current_user: Annotated[Principal, Depends(get_current_principal)], job_id: int):
+    _check_admin(current_user)
+    job = _get_job(job_id)
+    if not job_queue.cancel(job):
+        raise HTTPException(
+            status_code=409,
+            detail="Задача уже завершена"
+        )
+    return _info(_get_job(job_id))
+
+
+@router.get("/{job_id}/result", tags=["Фоновые задачи"])
+def job_result(current_user: Annotated[Principal, Depends(get_current_principal)], job_id: int):
+    _check_admin(current_user)
+    job = _get_job(job_id)
+    if job.status != "done":
+        raise HTTPException(
+            status_code=409,
+            detail="Результат еще не готов"
+        )
+    path = Path(job.result_file)
+    if not path.exists():
+        raise HTTPException(
+            status_code=410,
+            detail="Результат задачи удален"
+        )
+    return FileResponse(path, media_type=job.media_type, filename=f"{job.kind}-{job.id}{path.suffix}")
@@ -1,60 +1,94 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import Annotated
+from cache import response_cache
 from database.db import *
-from dependencies.current_user import get_current_user
+from dependencies.current_user import get_current_user, get_current_principal
+from models import GradePage, Principal
+from services import grade_listing
 
 
 router = APIRouter(prefix='/student')
 
 @router.get("/my_grades", tags=["Студент"])
-async def get_grades(current_user: Annotated[User, Depends(get_current_user)]): 
-    with db:
-        if current_user.role.name != "Студент":
-            raise HTTPException(
-                status_code=403,
-                detail="Просматривать оценки могут только студенты"
-            )
-            
-        try:
-            student = Student.get(Student.user == current_user)
-        except Student.DoesNotExist:
-            raise HTTPException(
-                status_code=404,
-                detail="Профиль студента не найден"
-                )
-            
-        grades = Grade.select().where(Grade.student == student)
+def get_grades(current_user: Annotated[Principal, Depends(get_current_principal)], request: Request):
+    if current_user.role != "Студент":
+        raise HTTPException(
+            status_code=403,
+            detail="Просматривать оценки могут только студенты"
+        )
+    if current_user.student_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Профиль студента не найден"
+        )
+    # попадание в кэш и 304 обходятся без обращения к базе
+    key = ("my_grades", current_user.id)
+    cached = response_cache.respond(request, key)
+    if cached is not None:
+        return cached
+    generation = response_cache.generation
+
+    with db.atomic():
+        teacher_user = User.alias()
+        grades = (Grade
+                  .select(Disciplines.name, Grade.grade, teacher_user.last_name,
+                          teacher_user.first_name, teacher_user.middle_name, Grade.created_at)
+                  .join(Disciplines)
+                  .switch(Grade)
+                  .join(teacher_user, on=(Grade.teacher == teacher_user.id))
+                  .where(Grade.student == current_user.student_id)
+                  .order_by(Grade.id)
+                  .tuples())
             
+        tags = [("student", current_user.student_id)]
         if not grades:
-            return {"message": "У вас пока нет оценок"}
+            return response_cache.render(request, key, {"message": "У вас пока нет оценок"},
+                                         tags, generation)
             
         answer = []
-        for grade in grades:
+        for discipline_name, grade_value, last_name, first_name, middle_name, created_at in grades:
             info = dict()
-            info["Дисциплина"] = grade.discipline.name
-            info["Оценка"] = grade.grade
-            info["Учитель"] = f"{grade.teacher.last_name} {grade.teacher.first_name} {grade.teacher.middle_name}"
-            info["Дата оценки"] = grade.created_at
+            info["Дисциплина"] = discipline_name
+            info["Оценка"] = grade_value
+            info["Учитель"] = f"{last_name} {first_name} {middle_name}"
+            info["Дата оценки"] = created_at
             answer.append(info)
-        return answer
+        return response_cache.render(request, key, answer, tags, generation)
+
+@router.get("/my_grades_page", tags=["Студент"])
+def get_grades_page(current_user: Annotated[Principal, Depends(get_current_principal)],
+                    page: Annotated[GradePage, Query()]):
+    if current_user.role != "Студент":
+        raise HTTPException(
+            status_code=403,
+            detail="Просматривать оценки могут только студенты"
+        )
+    if current_user.student_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Профиль студента не найден"
+        )
+    try:
+        return grade_listing.list_grades(page, student_id=current_user.student_id)
+    except grade_listing.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/edit-password",tags=["Студент"])
-async def edit_password(current_user: Annotated[User, Depends(get_current_user)], password: str):
-    with db:
-        if current_user.role.name == "Студент":
-            try:
-                user = User.get(
-                    (User.last_name == current_user.last_name) &
-                    (User.first_name == current_user.first_name) &
-                    (User.middle_name == current_user.middle_name)&
-                    (User.role == current_user.role)
-                )
-            except User.DoesNotExist:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Студент не найден"
-                )
-            
-            user.set_password(password)
-            user.save()
-            return {"message":"Пароль изменен"}
+def edit_password(current_user: Annotated[User, Depends(get_current_user)], password: str):
+    if current_user.role.name == "Студент":
+        try:
+            user = User.get(
+                (User.last_name == current_user.last_name) &
+                (User.first_name == current_user.first_name) &
+                (User.middle_name == current_user.middle_name)&
+                (User.role == current_user.role)
+            )
+        except User.DoesNotExist:
+            raise HTTPException(
+                status_code=404,
+                detail="Студент не найден"
+            )
+        
+        user.set_password(password)
+        user.save()
+        return {"message":"Пароль изменен"}
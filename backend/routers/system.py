@@ -1,32 +1,81 @@
 from fastapi import APIRouter, Depends, HTTPException
+from typing import Annotated
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from database.db import *
-from dependencies.auth_utils import create_jwt_token
-from models import Token
+from dependencies.auth_utils import (create_jwt_token, create_refresh_token, token_claims,
+                                    decode_token, verify_refresh_token)
+from dependencies.current_user import OAUTH2_SCHEME
+from instrumentation import metrics
+from models import Token, RefreshRequest
+from services.name_index import name_index
+from services.token_revocation import revoked_tokens
 from config import settings
 
 
 router = APIRouter()
 
+
+def _find_users(full_name, refresh=False):
+    # соединение сразу возвращается в пул, пока идет проверка пароля
+    with db.connection_context():
+        ids = [entry.user_id for entry in name_index.lookup(full_name, refresh)]
+        return list(User.select().where(User.id.in_(ids)).order_by(User.id))
+
+
 @router.post("/token", response_model=Token, tags=["system"])
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    try:
-        parts = form_data.username.split(' ')
-        if len(parts) != 3:
-            raise HTTPException(status_code=401, detail="Неверный формат имени")
-        
-        last_name, first_name, middle_name = parts
-        user = User.get(
-            (User.last_name == last_name) &
-            (User.first_name == first_name) & 
-            (User.middle_name == middle_name)
-        )
-        
-        if not user.check_password(form_data.password):
-            raise HTTPException(status_code=401, detail="Неверное имя пользователя или пароль")
-        
-        token = await create_jwt_token(data={"user_id": user.id}, expires_minutes=settings.access_token_expire_minutes)
-        return Token(access_token=token, token_type="bearer")
-        
-    except User.DoesNotExist:
-        raise HTTPException(status_code=401, detail="Пользователя нет в базе данных")
+    parts = form_data.username.split(' ')
+    if len(parts) != 3:
+        raise HTTPException(status_code=401, detail="Неверный формат имени")
+
+    checked = set()
+    # тезку, добавленного другим процессом, индекс увидит только после refresh
+    for refresh in (False, True):
+        users = await run_in_threadpool(_find_users, form_data.username, refresh)
+        if not users and not checked:
+            raise HTTPException(status_code=401, detail="Пользователя нет в базе данных")
+        # у тезок разные пароли, поэтому проверяются все кандидаты
+        for user in users:
+            if user.id in checked:
+                continue
+            checked.add(user.id)
+            if await user.check_password_async(form_data.password):
+                return await _issue_tokens(user)
+    raise HTTPException(status_code=401, detail="Неверное имя пользователя или пароль")
+
+
+async def _issue_tokens(user):
+    claims = await run_in_threadpool(token_claims, user)
+    token = await create_jwt_token(data=claims, expires_minutes=settings.access_token_expire_minutes)
+    return Token(access_token=token, token_type="bearer",
+                 refresh_token=await create_refresh_token(user))
+
+
+@router.post("/token/refresh", response_model=Token, tags=["system"])
+async def refresh(body: RefreshRequest):
+    # без bcrypt: достаточно подписи, срока и версии токенов пользователя
+    user, payload = await verify_refresh_token(body.refresh_token)
+    # refresh-токен одноразовый: новую пару получит только тот запрос, что первым отозвал jti
+    if not await run_in_threadpool(revoked_tokens.revoke, payload["jti"], payload["exp"]):
+        raise HTTPException(status_code=401, detail="Токен отозван")
+    return await _issue_tokens(user)
+
+
+@router.post("/logout", tags=["system"])
+async def logout(token: Annotated[str, Depends(OAUTH2_SCHEME)], body: RefreshRequest | None = None):
+    payload = decode_token(token)
+    await run_in_threadpool(revoked_tokens.revoke, payload["jti"], payload["exp"])
+    if body is not None:
+        refresh_payload = decode_token(body.refresh_token, "refresh")
+        if refresh_payload["user_id"] != payload["user_id"]:
+            raise HTTPException(status_code=400, detail="Refresh-токен другого пользователя")
+        await run_in_threadpool(revoked_tokens.revoke, refresh_payload["jti"], refresh_payload["exp"])
+    return {"message": "Токены отозваны"}
+
+
+@router.get("/metrics", response_class=PlainTextResponse, tags=["system"])
+async def get_metrics():
+    # пусто, пока metrics_enabled выключен
+    return metrics.render()
@@ -1,25 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from peewee import JOIN, chunked
 from typing import Annotated
+from cache import response_cache, grade_tags
 from database.db import *
-from dependencies.current_user import get_current_user
-from models import MassPutGrades
+from datetime import datetime
+from dependencies.current_user import get_current_principal
+from models import GradePage, MassPutGrades, Principal
+from services import grade_history, grade_listing, grade_stats
+from services.grade_events import grade_broker, grade_messages
+from services.name_index import name_index
 
 router = APIRouter(prefix="/teacher")
 
 @router.get("/grades/{group_name}",tags=["Учитель"])
-async def grade_group(current_user: Annotated[User, Depends(get_current_user)], group_name: str):
-    with db:
-        if current_user.role.name == "Преподаватель":
-            user_teacher = User.get((User.last_name == current_user.last_name) &
-                    (User.first_name == current_user.first_name) & 
-                    (User.middle_name == current_user.middle_name))
-            teacher = Teacher.get(Teacher.user == user_teacher)
-            discipline_teacher = teacher.discipline.name
-            if not discipline_teacher:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Пока что вы ничего не преподаете "
-                )
+def grade_group(current_user: Annotated[Principal, Depends(get_current_principal)], group_name: str,
+                request: Request):
+    if current_user.role == "Преподаватель":
+        if current_user.discipline_id is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Пока что вы ничего не преподаете "
+            )
+        key = ("teacher_grades", current_user.id, group_name)
+        cached = response_cache.respond(request, key)
+        if cached is not None:
+            return cached
+        generation = response_cache.generation
+
+        with db.atomic():
             try:
                 group = Group.get(Group.name == group_name)
             except Group.DoesNotExist:
@@ -28,53 +36,77 @@ async def grade_group(current_user: Annotated[User, Depends(get_current_user)],
                     detail=f"Группа {group_name} не найдена"
                 )
 
-            answer = []
-            all_students_this_group = Student.select().join(Group).where(Student.group == group)
-            for student in all_students_this_group:
-
-                student_grades = Grade.select().join(Disciplines).where(
-                    (Grade.student == student) & 
-                    (Disciplines.name == discipline_teacher)
-                )
+            rows = (Student
+                    .select(User.last_name, User.first_name, User.middle_name,
+                            Grade.grade, Grade.created_at)
+                    .join(User)
+                    .switch(Student)
+                    .join(Grade, JOIN.LEFT_OUTER, on=(
+                        (Grade.student == Student.id) &
+                        (Grade.discipline == current_user.discipline_id)))
+                    .where(Student.group == group)
+                    .order_by(Student.id, Grade.id)
+                    .tuples())
 
-                if student_grades.exists():
-                    for grade in student_grades:
-                        ans = dict()
-                        ans["Студент"] = f"{student.user.last_name} {student.user.first_name} {student.user.middle_name}"
-                        ans["Оценка"] = grade.grade
-                        ans["Дата"] = grade.created_at
-                        answer.append(ans)
-                else:
-                    ans = dict()
-                    ans["Студент"] = f"{student.user.last_name} {student.user.first_name} {student.user.middle_name}"
-                    ans["Оценка"] = None
-                    ans["Дата"] = None
-                    answer.append(ans)
+            answer = []
+            for last_name, first_name, middle_name, grade_value, created_at in rows:
+                ans = dict()
+                ans["Студент"] = f"{last_name} {first_name} {middle_name}"
+                ans["Оценка"] = grade_value
+                ans["Дата"] = created_at
+                answer.append(ans)
             
             if not answer:
-                return {"message": "Нет оценок по вашей дисциплине в этой группе"}
-            
-            return answer
+                answer = {"message": "Нет оценок по вашей дисциплине в этой группе"}
+            tags = [("group_discipline", group.id, current_user.discipline_id), ("members", group.id),
+                    ("discipline", current_user.discipline_id)]
+            return response_cache.render(request, key, answer, tags, generation)
         
-        elif current_user.role.name == "Студент":
-            raise HTTPException(
-                status_code=403,
-                detail="Студенты не могут просматривать оценки групп"
-            )
-        elif current_user.role.name == "Сотрудник учебного отдела":
-            raise HTTPException(
-                status_code=303,
-                detail="Используйте эндпоинт /administator/grades/{group_name}"
-            )
-        else:
-            raise HTTPException(
-                status_code=401,
-                detail="Неизвестная роль пользователя"
-            )
+    elif current_user.role == "Студент":
+        raise HTTPException(
+            status_code=403,
+            detail="Студенты не могут просматривать оценки групп"
+        )
+    elif current_user.role == "Сотрудник учебного отдела":
+        raise HTTPException(
+            status_code=303,
+            detail="Используйте эндпоинт /administator/grades/{group_name}"
+        )
+    else:
+        raise HTTPException(
+            status_code=401,
+            detail="Неизвестная роль пользователя"
+        )
+
+
+@router.get("/grades_page/{group_name}", tags=["Учитель"])
+def grade_group_page(current_user: Annotated[Principal, Depends(get_current_principal)], group_name: str,
+                     page: Annotated[GradePage, Query()]):
+    if current_user.role != "Преподаватель":
+        raise HTTPException(
+            status_code=403,
+            detail="Только преподаватели могут просматривать оценки по своей дисциплине"
+        )
+    if current_user.discipline_id is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Пока что вы ничего не преподаете "
+        )
+    try:
+        group = Group.get(Group.name == group_name)
+    except Group.DoesNotExist:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Группа {group_name} не найдена"
+        )
+    try:
+        return grade_listing.list_grades(page, group=group, discipline_id=current_user.discipline_id)
+    except grade_listing.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.patch("/mass-grades/{group_name}", tags=["Учитель"])        
-async def put_mass_grades_group(current_user: Annotated[User, Depends(get_current_user)], mpg: MassPutGrades):
+def put_mass_grades_group(current_user: Annotated[Principal, Depends(get_current_principal)], mpg: MassPutGrades):
     if not mpg.students or not mpg.grades:
         raise HTTPException(
             status_code=400,
@@ -87,18 +119,16 @@ async def put_mass_grades_group(current_user: Annotated[User, Depends(get_curren
             detail="Количество студентов должно совпадать с количеством оценок"
         )
         
-    with db:
-        if current_user.role.name != "Преподаватель":
+    with write_atomic():
+        if current_user.role != "Преподаватель":
             raise HTTPException(
                 status_code=403,
                 detail="Только преподаватели могут массово выставлять оценки"
             )
             
-        answer = []
         try:
-            teacher = Teacher.get(Teacher.user == current_user)
-            discipline = teacher.discipline
-        except Teacher.DoesNotExist:
+            discipline = Disciplines.get_by_id(current_user.discipline_id)
+        except Disciplines.DoesNotExist:
             raise HTTPException(
                 status_code=404,
                 detail="Информация о преподавателе не найдена"
@@ -112,40 +142,109 @@ async def put_mass_grades_group(current_user: Annotated[User, Depends(get_curren
                 detail="Активная сессия не найдена"
             )
 
-        for i in range(len(mpg.students)):
-            last_name,first_name,middle_name = mpg.students[i].split(" ")
-            try:
-                user = User.get(
-                    (User.last_name == last_name) &
-                    (User.first_name == first_name) &
-                    (User.middle_name == middle_name)
+        names = []
+        for student in mpg.students:
+            parts = student.split(" ")
+            if len(parts) != 3:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Неверный формат имени: {student}"
+                )
+            names.append(tuple(parts))
+
+        full_names = [" ".join(name) for name in names]
+        resolved = name_index.lookup_many(full_names)
+        # в индексе этого процесса может не быть студентов, добавленных другим процессом
+        unknown = [full_name for full_name, key in zip(full_names, map(normalize_name, full_names))
+                   if not any(entry.student_id is not None for entry in resolved[key])]
+        if unknown:
+            resolved.update(name_index.lookup_many(unknown, refresh=True))
+
+        students = dict()
+        group = None
+        for name in dict.fromkeys(names):
+            candidates = [entry for entry in resolved[normalize_name(*name)] if entry.student_id is not None]
+            if len(candidates) > 1:
+                # тезки: берется студент из группы, которой выставляются оценки
+                if group is None:
+                    group = Group.get_or_none(Group.name == mpg.group_name)
+                candidates = [entry for entry in candidates if group is not None and entry.group_id == group.id]
+                if len(candidates) > 1:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"В группе несколько студентов с именем {' '.join(name)}"
                     )
-                
-                student_name = Student.get(Student.user == user)
-            except (User.DoesNotExist,Student.DoesNotExist):
+            if not candidates:
                 raise HTTPException(
                     status_code=404,
                     detail="Студент не найден"
                 )
-            grade_student = mpg.grades[i]
-            stud_grade, created = Grade.get_or_create(
-            student=student_name,
-            discipline=discipline,
-            session=current_session,
-            )
-            if not created:
-                stud_grade.grade = grade_student
-                stud_grade.teacher = current_user
-                stud_grade.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                stud_grade.save()
+            students[name] = (candidates[0].student_id, candidates[0].group_id)
+
+        now = datetime.now()
+        created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+        # студент может повториться в списке: остается последняя оценка, иначе PostgreSQL
+        # отклонит пачку upsert (command cannot affect row a second time)
+        rows = {
+            students[name][0]: {
+                "student": students[name][0],
+                "discipline": discipline.id,
+                "session": current_session.id,
+                "grade": grade_student,
+                "teacher": current_user.id,
+                "created_at": created_at,
+            }
+            for name, grade_student in zip(names, mpg.grades)
+        }
+        current_grades = dict(Grade
+                              .select(Grade.student, Grade.grade)
+                              .where((Grade.student.in_([student_id for student_id, _ in students.values()])) &
+                                     (Grade.discipline == discipline) &
+                                     (Grade.session == current_session))
+                              .tuples())
+        changes = []
+        history = []
+        for name, grade_student in zip(names, mpg.grades):
+            student_id, group_id = students[name]
+            changes.append((group_id, discipline.id, current_session.id,
+                            current_grades.get(student_id), grade_student))
+            history.append((student_id, discipline.id, current_session.id,
+                            current_grades.get(student_id), grade_student))
+            current_grades[student_id] = grade_student
 
+        with db.atomic():
+            grade_stats.apply_changes(changes)
+            grade_history.record(history, current_user.id, grade_history.MASS_GRADES, now)
+            for batch in chunked(list(rows.values()), 100):
+                (Grade
+                 .insert_many(batch)
+                 .on_conflict(
+                     conflict_target=[Grade.student, Grade.discipline, Grade.session],
+                     preserve=[Grade.grade, Grade.teacher, Grade.created_at])
+                 .execute())
+        tags = set()
+        for student_id, group_id in students.values():
+            tags.update(grade_tags(student_id, group_id, discipline.id))
+        on_commit(lambda: response_cache.invalidate(tags))
+        # у тезок из разных групп разные group_id, поэтому по сообщению на группу
+        by_group = dict()
+        for name, grade_student in zip(names, mpg.grades):
+            student_id, group_id = students[name]
+            by_group.setdefault(group_id, dict())[student_id] = (student_id, " ".join(name), grade_student)
+        messages = [message
+                    for group_id, grades in by_group.items()
+                    for message in grade_messages(group_id, discipline.id, discipline.name,
+                                                  current_session.name_session, list(grades.values()),
+                                                  current_user.id)]
+        on_commit(lambda: grade_broker.publish(messages))
+
+        answer = []
+        for name, grade_student in zip(names, mpg.grades):
             for_answer = dict()
-            for_answer["Студент"] = f"{student_name.user.last_name} {student_name.user.first_name} {student_name.user.middle_name}"
-            for_answer["Оценка"] = grade_student  
+            for_answer["Студент"] = " ".join(name)
+            for_answer["Оценка"] = grade_student
             for_answer["Дисциплина"] = discipline.name
             for_answer["Сессия"] = current_session.name_session
-            for_answer["Дата"] = datetime.now()
+            for_answer["Дата"] = now
             answer.append(for_answer)
-            stud_grade.save()
-                    
-        return answer
\ No newline at end of file
+        return answer
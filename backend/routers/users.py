@@ -7,8 +7,8 @@ from dependencies.current_user import get_current_user
 router = APIRouter()
 
 @router.get("/users/me/", tags=["Пользователи"])
-async def read_user_me(current_user: Annotated[User, Depends(get_current_user)]):
-    with db:
+def read_user_me(current_user: Annotated[User, Depends(get_current_user)]):
+    with db.atomic():
         if current_user.role.name == "Студент":
             try:
                 group = Student.get(Student.user == current_user)
@@ -0,0 +1,159 @@
+import numpy as np
+from cache import create_cache
+from config import settings
+from database.db import db, User, Group, Student, Disciplines, SessionPeriod, Grade
+
+report_cache = create_cache("reports", maxsize=16, ttl=settings.report_cache_ttl)
+
+
+class GradeFrame:
+    """Оценки в колоночном виде: по массиву на колонку, справочники имен отдельно.
+
+    Идентификаторы студентов, групп, дисциплин и сессий заменены плотными индексами
+    0..n-1, чтобы агрегаты считались через np.bincount без словарей.
+    """
+
+    def __init__(self, rows, students, groups, disciplines, sessions):
+        data = np.array(rows, dtype=np.int64).reshape(-1, 5)
+        self.student_ids, first, self.student = np.unique(data[:, 0], return_index=True,
+                                                          return_inverse=True)
+        self.group_ids, self.student_group = np.unique(data[first, 1], return_inverse=True)
+        self.group = self.student_group[self.student]
+        self.discipline_ids, self.discipline = np.unique(data[:, 2], return_inverse=True)
+        # сессии нумеруются в порядке словаря sessions (по дате начала)
+        chronology = np.zeros(max(sessions, default=0) + 1, dtype=np.int64)
+        chronology[list(sessions)] = np.arange(len(sessions))
+        self.session_order, self.session = np.unique(chronology[data[:, 3]], return_inverse=True)
+        self.grade = data[:, 4]
+        self.student_names = [students[id] for id in self.student_ids]
+        self.group_names = [groups[id] for id in self.group_ids]
+        self.discipline_names = [disciplines[id] for id in self.discipline_ids]
+        names = list(sessions.values())
+        self.session_names = [names[position] for position in self.session_order]
+
+    def __len__(self):
+        return len(self.grade)
+
+
+def load_frame(session=None):
+    """Загружает оценки одним запросом и справочники по одному запросу на таблицу."""
+    query = (Grade
+             .select(Grade.student, Student.group, Grade.discipline, Grade.session, Grade.grade)
+             .join(Student)
+             .join_from(Grade, Disciplines)
+             .join_from(Grade, SessionPeriod)
+             .where(Grade.grade.is_null(False)))
+    if session is not None:
+        query = query.where(SessionPeriod.name_session == session)
+    # строки берутся с курсора напрямую: только целые числа, обертки peewee не нужны
+    rows = db.execute(query).fetchall()
+    students = {
+        id: f"{last_name} {first_name} {middle_name}"
+        for id, last_name, first_name, middle_name in
+        Student.select(Student.id, User.last_name, User.first_name, User.middle_name)
+        .join(User).tuples()
+    }
+    groups = dict(Group.select(Group.id, Group.name).tuples())
+    disciplines = dict(Disciplines.select(Disciplines.id, Disciplines.name).tuples())
+    # порядок по дате начала, чтобы тренды шли в хронологическом порядке
+    sessions = dict(SessionPeriod.select(SessionPeriod.id, SessionPeriod.name_session)
+                    .order_by(SessionPeriod.start_date, SessionPeriod.id).tuples())
+    return GradeFrame(rows, students, groups, disciplines, sessions)
+
+
+def _means(index, values, size):
+    counts = np.bincount(index, minlength=size)
+    sums = np.bincount(index, weights=values, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts, counts
+
+
+def student_ranking(frame):
+    """Средний балл каждого студента и место в группе (равный балл — равное место)."""
+    gpa, counts = _means(frame.student, frame.grade, len(frame.student_ids))
+    failures = np.bincount(frame.student, weights=frame.grade == 2, minlength=len(frame.student_ids))
+    order = np.lexsort((-gpa, frame.student_group))
+    group_sorted = frame.student_group[order]
+    gpa_sorted = gpa[order]
+    positions = np.arange(len(order))
+    group_start = np.ones(len(order), dtype=bool)
+    group_start[1:] = group_sorted[1:] != group_sorted[:-1]
+    value_start = group_start.copy()
+    value_start[1:] |= gpa_sorted[1:] != gpa_sorted[:-1]
+    first_in_group = np.maximum.accumulate(np.where(group_start, positions, 0))
+    first_with_value = np.maximum.accumulate(np.where(value_start, positions, 0))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = first_with_value - first_in_group + 1
+    return [
+        {
+            "Студент": frame.student_names[i],
+            "Группа": frame.group_names[frame.student_group[i]],
+            "Средний балл": round(float(gpa[i]), 2),
+            "Оценок": int(counts[i]),
+            "Двоек": int(failures[i]),
+            "Место в группе": int(rank[i]),
+        }
+        for i in order
+    ]
+
+
+def discipline_difficulty(frame):
+    """Дисциплины от самой трудной: по среднему баллу и доле двоек."""
+    size = len(frame.discipline_ids)
+    mean, counts = _means(frame.discipline, frame.grade, size)
+    failures = np.bincount(frame.discipline, weights=frame.grade == 2, minlength=size)
+    return [
+        {
+            "Дисциплина": frame.discipline_names[i],
+            "Средний балл": round(float(mean[i]), 2),
+            "Оценок": int(counts[i]),
+            "Доля двоек": round(float(failures[i] / counts[i]), 4),
+        }
+        for i in np.lexsort((-failures / np.maximum(counts, 1), mean))
+    ]
+
+
+def session_trends(frame):
+    """Средний балл группы по сессиям и изменение относительно предыдущей сессии группы."""
+    sessions = len(frame.session_order)
+    mean, counts = _means(frame.group * sessions + frame.session, frame.grade,
+                          len(frame.group_ids) * sessions)
+    answer = []
+    for group, name in enumerate(frame.group_names):
+        previous = None
+        trend = []
+        for session in range(sessions):
+            cell = group * sessions + session
+            if not counts[cell]:
+                continue
+            value = round(float(mean[cell]), 2)
+            trend.append({
+                "Сессия": frame.session_names[session],
+                "Средний балл": value,
+                "Изменение": None if previous is None else round(value - previous, 2),
+            })
+            previous = value
+        answer.append({"Группа": name, "Сессии": trend})
+    return answer
+
+
+def build_report(session=None):
+    frame = load_frame(session)
+    if not len(frame):
+        return {"students": [], "at_risk": [], "disciplines": [], "trends": []}
+    students = student_ranking(frame)
+    return {
+        "students": students,
+        "at_risk": [student for student in students if student["Двоек"]],
+        "disciplines": discipline_difficulty(frame),
+        "trends": session_trends(frame),
+    }
+
+
+def get_report(session=None):
+    """Отчет из кэша; пересчитывается не чаще, чем раз в report_cache_ttl секунд."""
+    report = report_cache.get(session)
+    if report is None:
+        report = build_report(session)
+        report_cache.set(session, report)
+    return report
@@ -0,0 +1,147 @@
+import asyncio, json, threading, time
+from datetime import datetime
+from cache import redis, redis_client
+from config import settings
+
+# сообщение подписчику, который не успевал читать: ему нужно перечитать оценки заново
+RESYNC = "event: resync\ndata: {}\n\n"
+
+
+def student_topic(student_id):
+    return ("student", student_id)
+
+
+def group_topic(group_id, discipline_id=None):
+    """Оценки группы: по одной дисциплине (преподаватель) или по всем (учебный отдел)."""
+    if discipline_id is None:
+        return ("group", group_id)
+    return ("group_discipline", group_id, discipline_id)
+
+
+def _sse(data: dict) -> str:
+    return f"event: grades\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def grade_messages(group_id, discipline_id, discipline, session, grades, teacher_id):
+    """Сообщения об изменении оценок одной дисциплины в группе.
+
+    grades — тройки (student_id, ФИО, оценка). Группе уходит одно сообщение со всеми
+    оценками, каждому студенту — только его. Текст SSE собирается один раз на тему,
+    а не на каждого подписчика.
+    """
+    at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    base = dict(group_id=group_id, discipline_id=discipline_id, discipline=discipline,
+                session=session, teacher_id=teacher_id, at=at)
+    items = [dict(student_id=student_id, student=name, grade=grade) for student_id, name, grade in grades]
+    group = _sse(dict(base, grades=items))
+    messages = [(group_topic(group_id), group), (group_topic(group_id, discipline_id), group)]
+    for item in items:
+        messages.append((student_topic(item["student_id"]), _sse(dict(base, grades=[item]))))
+    return messages
+
+
+class Subscription:
+    __slots__ = ('topics', 'queue')
+
+    def __init__(self, topics, queue_size):
+        self.topics = topics
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+
+class GradeBroker:
+    """Рассылка изменений оценок подписчикам SSE этого процесса.
+
+    Подписчик — очередь в event loop, без потока на соединение, так что тысячи
+    ожидающих соединений стоят только памяти. publish потокобезопасен: сообщения
+    передаются в loop через call_soon_threadsafe. С cache_backend=redis публикация идет
+    через канал <prefix>grades, и каждый процесс раздает сообщения своим подписчикам.
+    """
+
+    def __init__(self, client=None):
+        self.client = client
+        self.channel = settings.cache_prefix + "grades"
+        self._topics = dict()
+        self._count = 0
+        self._loop = None
+        self._listener = None
+
+    @property
+    def connections(self) -> int:
+        return self._count
+
+    def start(self, loop):
+        self._loop = loop
+        if self.client is not None and self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name="grade-events", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    messages = [(tuple(topic), text) for topic, text in json.loads(message["data"])]
+                    self._loop.call_soon_threadsafe(self._dispatch, messages)
+            except redis.RedisError:
+                # сообщения за время обрыва теряются, клиенты увидят их при следующем чтении
+                time.sleep(1)
+
+    def subscribe(self, topics) -> Subscription:
+        subscription = Subscription(topics, settings.grade_events_queue_size)
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is None or subscription not in subscribers:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[topic]
+        if subscription.topics:
+            subscription.topics = ()
+            self._count -= 1
+
+    def publish(self, messages):
+        """Вызывается после коммита, в том числе из потоков синхронных эндпоинтов."""
+        if self.client is not None:
+            self.client.publish(self.channel, json.dumps(messages, ensure_ascii=False))
+        elif self._loop is not None and self._count:
+            self._loop.call_soon_threadsafe(self._dispatch, messages)
+
+    def _dispatch(self, messages):
+        for topic, text in messages:
+            for subscription in list(self._topics.get(topic, ())):
+                try:
+                    subscription.queue.put_nowait(text)
+                except asyncio.QueueFull:
+                    # медленный клиент отключается, а не копит сообщения в памяти
+                    self.unsubscribe(subscription)
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.queue.put_nowait(RESYNC)
+
+    async def stream(self, topics):
+        """Поток SSE для подписки на topics, пока клиент не отключится."""
+        subscription = self.subscribe(topics)
+        try:
+            yield f"retry: {settings.grade_events_retry_ms}\n\n"
+            while True:
+                try:
+                    text = await asyncio.wait_for(subscription.queue.get(), settings.grade_events_keepalive)
+                except asyncio.TimeoutError:
+                    # комментарий не дает прокси закрыть простаивающее соединение
+                    yield ": keepalive\n\n"
+                    continue
+                yield text
+                if text is RESYNC:
+                    return
+        finally:
+            self.unsubscribe(subscription)
+
+
+grade_broker = GradeBroker(redis_client)
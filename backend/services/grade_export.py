@@ -0,0 +1,106 @@
+import csv, io, json
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
+from database.db import db, User, Group, Student, Disciplines, SessionPeriod, Grade
+
+COLUMNS = ("group", "student", "discipline", "session", "grade", "teacher", "created_at")
+BATCH_SIZE = 1000
+
+
+def _query(group=None, session=None, discipline=None):
+    teacher_user = User.alias()
+    query = (Grade
+             .select(Grade.id, Group.name, User.last_name, User.first_name, User.middle_name,
+                     Disciplines.name, SessionPeriod.name_session, Grade.grade,
+                     teacher_user.last_name, teacher_user.first_name, teacher_user.middle_name,
+                     Grade.created_at)
+             .join(Student)
+             .join(User)
+             .switch(Student)
+             .join(Group)
+             .switch(Grade)
+             .join(Disciplines)
+             .switch(Grade)
+             .join(SessionPeriod)
+             .switch(Grade)
+             .join(teacher_user, on=(Grade.teacher == teacher_user.id)))
+    if group is not None:
+        query = query.where(Group.name == group)
+    if session is not None:
+        query = query.where(SessionPeriod.name_session == session)
+    if discipline is not None:
+        query = query.where(Disciplines.name == discipline)
+    return query.order_by(Grade.id)
+
+
+def _fetch_batch(query, after_id):
+    with db.connection_context():
+        rows = query.where(Grade.id > after_id).limit(BATCH_SIZE).tuples().iterator()
+        return [
+            (grade_id, (group, f"{last_name} {first_name} {middle_name}", discipline, session, grade,
+                        f"{t_last_name} {t_first_name} {t_middle_name}",
+                        created_at.isoformat() if isinstance(created_at, datetime) else created_at))
+            for (grade_id, group, last_name, first_name, middle_name, discipline, session, grade,
+                 t_last_name, t_first_name, t_middle_name, created_at) in rows
+        ]
+
+
+async def iter_rows(group=None, session=None, discipline=None):
+    """Отдает оценки пачками по первичному ключу, в памяти держится не больше одной пачки."""
+    query = _query(group, session, discipline)
+    after_id = 0
+    while True:
+        batch = await run_in_threadpool(_fetch_batch, query, after_id)
+        if not batch:
+            return
+        after_id = batch[-1][0]
+        yield [row for _, row in batch]
+        if len(batch) < BATCH_SIZE:
+            return
+
+
+async def export_csv(**filters):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for rows in iter_rows(**filters):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def export_ndjson(**filters):
+    async for rows in iter_rows(**filters):
+        yield "".join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+def export_to_file(path, format="csv", progress=None, **filters):
+    """Выгрузка в файл для фоновой задачи; progress(выгружено, всего) вызывается после каждой пачки."""
+    query = _query(**filters)
+    with db.connection_context():
+        total = query.count()
+    done = 0
+    after_id = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        if format == "csv":
+            writer.writerow(COLUMNS)
+        while True:
+            batch = _fetch_batch(query, after_id)
+            if not batch:
+                break
+            after_id = batch[-1][0]
+            rows = [row for _, row in batch]
+            if format == "csv":
+                writer.writerows(rows)
+            else:
+                file.write("".join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows))
+            done += len(rows)
+            if progress is not None:
+                progress(done, total)
+            if len(batch) < BATCH_SIZE:
+                break
+    return done
@@ -0,0 +1,240 @@
+import asyncio, heapq, itertools, json, peewee
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from peewee import Tuple, chunked
+from config import settings
+from database.db import (db, write_atomic, User, Student, Disciplines, SessionPeriod, Grade,
+                         GradeChange, GradeHistoryArchive)
+
+PUT_GRADE, MASS_GRADES, IMPORT = "put_grade", "mass_grades", "import"
+DELETE_DISCIPLINE = "delete_discipline"
+
+
+def record(changes, changed_by, source, changed_at=None):
+    """Добавляет в журнал изменения (student_id, discipline_id, session_id, старая, новая).
+
+    Вызывается внутри транзакции записи оценок, поэтому журнал и Grade коммитятся вместе.
+    Записи без изменения оценки пропускаются.
+    """
+    changed_at = changed_at or datetime.now()
+    rows = [(student_id, discipline_id, session_id, old_grade, new_grade, changed_by, source, changed_at)
+            for student_id, discipline_id, session_id, old_grade, new_grade in changes
+            if old_grade != new_grade]
+    fields = [GradeChange.student_id, GradeChange.discipline_id, GradeChange.session_id,
+              GradeChange.old_grade, GradeChange.new_grade, GradeChange.changed_by,
+              GradeChange.source, GradeChange.changed_at]
+    for batch in chunked(rows, 100):
+        GradeChange.insert_many(batch, fields=fields).execute()
+    return len(rows)
+
+
+def current_grades(keys):
+    """Текущие оценки по ключам (student_id, discipline_id, session_id), до перезаписи."""
+    found = dict()
+    for batch in chunked(list(keys), 300):
+        rows = (Grade
+                .select(Grade.student, Grade.discipline, Grade.session, Grade.grade)
+                .where(Tuple(Grade.student, Grade.discipline, Grade.session).in_(batch))
+                .tuples())
+        for student_id, discipline_id, session_id, grade in rows:
+            found[(student_id, discipline_id, session_id)] = grade
+    return found
+
+
+def _live(student_ids, user_ids, date_from, date_to, session_id, limit):
+    query = (GradeChange
+             .select(GradeChange.changed_at, GradeChange.student_id, GradeChange.discipline_id,
+                     GradeChange.session_id, GradeChange.old_grade, GradeChange.new_grade,
+                     GradeChange.changed_by, GradeChange.source))
+    if student_ids is not None:
+        query = query.where(GradeChange.student_id.in_(student_ids))
+    if user_ids is not None:
+        query = query.where(GradeChange.changed_by.in_(user_ids))
+    if session_id is not None:
+        query = query.where(GradeChange.session_id == session_id)
+    if date_from is not None:
+        query = query.where(GradeChange.changed_at >= date_from)
+    if date_to is not None:
+        query = query.where(GradeChange.changed_at < date_to)
+    return list(query.order_by(GradeChange.changed_at.desc(), GradeChange.id.desc()).limit(limit).tuples())
+
+
+def _archived(student_ids, user_ids, date_from, date_to, session_id, limit):
+    archive = GradeHistoryArchive
+    query = archive.select(archive.student_id, archive.discipline_id, archive.session_id, archive.changed_by,
+                           archive.changes, archive.last_change)
+    if student_ids is not None:
+        query = query.where(archive.student_id.in_(student_ids))
+    if user_ids is not None:
+        query = query.where(archive.changed_by.in_(user_ids))
+    if session_id is not None:
+        query = query.where(archive.session_id == session_id)
+    if date_from is not None:
+        query = query.where(archive.last_change >= date_from)
+    if date_to is not None:
+        query = query.where(archive.first_change < date_to)
+    query = query.order_by(archive.last_change.desc(), archive.id.desc())
+    # limit самых новых изменений: куча по времени, строки читаются страницами от новых к старым
+    found = []
+    order = itertools.count()
+    offset = 0
+    while True:
+        page = list(query.limit(limit).offset(offset).tuples())
+        for row_student, discipline_id, row_session, changed_by, changes, last_change in page:
+            newest = last_change if date_to is None else min(last_change, date_to)
+            if len(found) >= limit and newest <= found[0][0]:
+                # у следующих строк last_change не больше: новее найденных изменений там нет
+                return [row for _, _, row in sorted(found, reverse=True)]
+            for changed_at, old_grade, new_grade, source in json.loads(changes):
+                changed_at = datetime.fromisoformat(changed_at)
+                if date_from is not None and changed_at < date_from:
+                    continue
+                if date_to is not None and changed_at >= date_to:
+                    continue
+                row = (changed_at, row_student, discipline_id, row_session, old_grade, new_grade, changed_by, source)
+                if len(found) < limit:
+                    heapq.heappush(found, (changed_at, next(order), row))
+                elif changed_at > found[0][0]:
+                    heapq.heapreplace(found, (changed_at, next(order), row))
+        if len(page) < limit:
+            return [row for _, _, row in sorted(found, reverse=True)]
+        offset += limit
+
+
+def history(student_ids=None, user_ids=None, date_from=None, date_to=None, session_id=None, limit=100):
+    """Изменения оценок от новых к старым: из журнала и из архива сжатых сессий.
+
+    student_ids — чьи оценки, user_ids — кто менял (преподаватель или учебный отдел).
+    Фильтры по студенту, автору изменения и времени идут по индексам GradeChange
+    и GradeHistoryArchive; из архива читаются только строки с самыми новыми изменениями.
+    """
+    rows = _live(student_ids, user_ids, date_from, date_to, session_id, limit)
+    rows += _archived(student_ids, user_ids, date_from, date_to, session_id, limit)
+    rows.sort(key=lambda row: row[0], reverse=True)
+    rows = rows[:limit]
+
+    students = {row[1] for row in rows}
+    users = {row[6] for row in rows}
+    names = dict()
+    for batch in chunked(list(students), 300):
+        for sid, last_name, first_name, middle_name in (Student
+                                                        .select(Student.id, User.last_name, User.first_name,
+                                                                User.middle_name)
+                                                        .join(User)
+                                                        .where(Student.id.in_(batch))
+                                                        .tuples()):
+            names[("student", sid)] = f"{last_name} {first_name} {middle_name}"
+    for batch in chunked(list(users), 300):
+        for uid, last_name, first_name, middle_name in (User
+                                                        .select(User.id, User.last_name, User.first_name,
+                                                                User.middle_name)
+                                                        .where(User.id.in_(batch))
+                                                        .tuples()):
+            names[("user", uid)] = f"{last_name} {first_name} {middle_name}"
+    disciplines = dict(Disciplines.select(Disciplines.id, Disciplines.name).tuples())
+    sessions = dict(SessionPeriod.select(SessionPeriod.id, SessionPeriod.name_session).tuples())
+
+    answer = []
+    for changed_at, sid, discipline_id, session, old_grade, new_grade, changed_by, source in rows:
+        info = dict()
+        info["Дата"] = changed_at
+        info["Студент"] = names.get(("student", sid), sid)
+        info["Дисциплина"] = disciplines.get(discipline_id, discipline_id)
+        info["Сессия"] = sessions.get(session, session)
+        info["Было"] = old_grade
+        info["Стало"] = new_grade
+        info["Изменил"] = names.get(("user", changed_by), changed_by)
+        info["Источник"] = source
+        answer.append(info)
+    return answer
+
+
+def compactable_sessions():
+    """Закрытые сессии, закончившиеся больше history_compact_after_days дней назад."""
+    before = datetime.now().date() - timedelta(days=settings.history_compact_after_days)
+    return [session_id for session_id, in (SessionPeriod
+                                           .select(SessionPeriod.id)
+                                           .where((SessionPeriod.is_active == False) &
+                                                  (SessionPeriod.end_date < before))
+                                           .tuples())]
+
+
+def compact(session_id):
+    """Переносит журнал сессии в GradeHistoryArchive: строка на оценку и автора вместо строки на изменение.
+
+    Повторное сжатие (после поздних исправлений) дописывает изменения к уже сжатым.
+    Возвращает число перенесенных изменений.
+    """
+    with write_atomic():
+        rows = list(GradeChange
+                    .select(GradeChange.id, GradeChange.student_id, GradeChange.discipline_id,
+                            GradeChange.changed_at, GradeChange.old_grade, GradeChange.new_grade,
+                            GradeChange.changed_by, GradeChange.source)
+                    .where(GradeChange.session_id == session_id)
+                    .order_by(GradeChange.id)
+                    .tuples())
+        if not rows:
+            return 0
+        grouped = dict()
+        for _, student_id, discipline_id, changed_at, old_grade, new_grade, changed_by, source in rows:
+            grouped.setdefault((student_id, discipline_id, changed_by), []).append(
+                [changed_at.isoformat(" ") if isinstance(changed_at, datetime) else changed_at,
+                 old_grade, new_grade, source])
+        existing = dict()
+        for batch in chunked(list(grouped), 300):
+            query = (GradeHistoryArchive
+                     .select(GradeHistoryArchive.student_id, GradeHistoryArchive.discipline_id,
+                             GradeHistoryArchive.changed_by, GradeHistoryArchive.changes)
+                     .where((GradeHistoryArchive.session_id == session_id) &
+                            Tuple(GradeHistoryArchive.student_id, GradeHistoryArchive.discipline_id,
+                                  GradeHistoryArchive.changed_by).in_(batch))
+                     .tuples())
+            for student_id, discipline_id, changed_by, changes in query:
+                existing[(student_id, discipline_id, changed_by)] = json.loads(changes)
+        archive = []
+        for key, changes in grouped.items():
+            changes = existing.get(key, []) + changes
+            archive.append((session_id, *key, json.dumps(changes, ensure_ascii=False),
+                            datetime.fromisoformat(changes[0][0]), datetime.fromisoformat(changes[-1][0])))
+        fields = [GradeHistoryArchive.session_id, GradeHistoryArchive.student_id,
+                  GradeHistoryArchive.discipline_id, GradeHistoryArchive.changed_by, GradeHistoryArchive.changes,
+                  GradeHistoryArchive.first_change, GradeHistoryArchive.last_change]
+        for batch in chunked(archive, 100):
+            (GradeHistoryArchive
+             .insert_many(batch, fields=fields)
+             .on_conflict(conflict_target=[GradeHistoryArchive.session_id, GradeHistoryArchive.student_id,
+                                           GradeHistoryArchive.discipline_id, GradeHistoryArchive.changed_by],
+                          preserve=[GradeHistoryArchive.changes, GradeHistoryArchive.first_change,
+                                    GradeHistoryArchive.last_change])
+             .execute())
+        (GradeChange
+         .delete()
+         .where((GradeChange.session_id == session_id) & (GradeChange.id <= rows[-1][0]))
+         .execute())
+    return len(rows)
+
+
+def compact_closed(progress=None):
+    """Сжимает журнал всех закрытых сессий; progress(сессий, всего) после каждой."""
+    sessions = compactable_sessions()
+    moved = 0
+    for done, session_id in enumerate(sessions, start=1):
+        moved += compact(session_id)
+        if progress is not None:
+            progress(done, len(sessions))
+    return moved
+
+
+def _compact_closed():
+    with db.connection_context():
+        return compact_closed()
+
+
+async def compact_periodically():
+    while True:
+        await asyncio.sleep(settings.history_compact_hours * 3600)
+        try:
+            await run_in_threadpool(_compact_closed)
+        except peewee.OperationalError:
+            # база занята; следующая попытка через history_compact_hours
+            continue
@@ -0,0 +1,132 @@
+import csv, io, itertools
+from datetime import datetime
+from cache import response_cache, grade_tags
+from database.db import db, write_atomic, Group, Disciplines, SessionPeriod, Grade
+from services import grade_history, grade_stats
+from services.name_index import name_index
+
+COLUMNS = ("student", "group", "discipline", "session", "grade")
+TRANSACTION_SIZE = 2000
+
+
+def load_lookups():
+    """Загружает справочники для импорта целиком, по одному запросу на таблицу; студенты ищутся в name_index."""
+    groups = {name: id for id, name in Group.select(Group.id, Group.name).tuples()}
+    disciplines = {name: id for id, name in Disciplines.select(Disciplines.id, Disciplines.name).tuples()}
+    sessions = dict()
+    for id, name in SessionPeriod.select(SessionPeriod.id, SessionPeriod.name_session).tuples():
+        sessions.setdefault(name, id)
+    return groups, disciplines, sessions
+
+
+def read_rows(binary_file, columns=COLUMNS, optional=()):
+    """Построчно читает CSV (разделитель , или ;) не загружая файл в память целиком.
+
+    Колонки из optional можно не указывать в файле, их значения будут пустыми.
+    """
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    header = text.readline()
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    reader = csv.reader(itertools.chain([header], text), delimiter=delimiter)
+    header_columns = [column.strip().lower() for column in next(reader, [])]
+    missing = [column for column in columns if column not in header_columns and column not in optional]
+    if missing:
+        raise ValueError(f"В файле нет колонок: {', '.join(missing)}")
+    positions = [header_columns.index(column) if column in header_columns else None for column in columns]
+    try:
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            yield reader.line_num, [row[i].strip() if i is not None and i < len(row) else "" for i in positions]
+    finally:
+        text.detach()
+
+
+FIELDS = [Grade.student, Grade.discipline, Grade.session, Grade.grade, Grade.teacher, Grade.created_at]
+
+
+def _upsert_sql():
+    # SQL строится peewee один раз, дальше строки передаются в executemany
+    # без повторной генерации запроса на каждую пачку
+    sql, _ = (Grade
+              .insert_many([(None,) * len(FIELDS)], fields=FIELDS)
+              .on_conflict(
+                  conflict_target=[Grade.student, Grade.discipline, Grade.session],
+                  preserve=[Grade.grade, Grade.teacher, Grade.created_at])
+              .sql())
+    return sql
+
+
+def _write(rows, changed_by):
+    # текущие оценки читаются перед записью: под WAL отложенная транзакция
+    # не смогла бы перейти к записи, если кто-то записал после чтения
+    with write_atomic():
+        current = grade_history.current_grades({row[:3] for row in rows})
+        changes = []
+        for student_id, discipline_id, session_id, grade, _, _ in rows:
+            key = (student_id, discipline_id, session_id)
+            changes.append((*key, current.get(key), grade))
+            current[key] = grade
+        grade_history.record(changes, changed_by, grade_history.IMPORT)
+        db.execute_many(_upsert_sql(), rows)
+
+
+def import_grades(binary_file, teacher_id, progress=None):
+    """Импортирует оценки из CSV, возвращает число записанных строк и список ошибок по строкам.
+
+    progress(обработано строк, None) вызывается после каждой записанной пачки; исключение
+    из него останавливает импорт, уже записанные пачки остаются.
+    """
+    groups, disciplines, sessions = load_lookups()
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    imported = 0
+    errors = []
+    pending = []
+    affected = set()
+    tags = set()
+    try:
+        for line, (student, group, discipline, session, grade) in read_rows(binary_file):
+            parts = student.split()
+            if len(parts) != 3:
+                errors.append({"row": line, "detail": f"Неверный формат имени: {student}"})
+                continue
+            if group not in groups:
+                errors.append({"row": line, "detail": f"Группа {group} не найдена"})
+                continue
+            entries = name_index.students(student, groups[group])
+            if not entries:
+                errors.append({"row": line, "detail": f"Студент {student} не найден в группе {group}"})
+                continue
+            if len(entries) > 1:
+                # тезок в файле не различить, оценку выставляют через put_grade с user_id
+                errors.append({"row": line, "detail": f"В группе {group} несколько студентов с именем {student}"})
+                continue
+            student_id = entries[0].student_id
+            if discipline not in disciplines:
+                errors.append({"row": line, "detail": f"Дисциплина {discipline} не найдена"})
+                continue
+            if session not in sessions:
+                errors.append({"row": line, "detail": f"Сессия {session} не найдена"})
+                continue
+            if grade not in ("2", "3", "4", "5"):
+                errors.append({"row": line, "detail": f"Недопустимая оценка: {grade}"})
+                continue
+            pending.append((student_id, disciplines[discipline], sessions[session],
+                            int(grade), teacher_id, created_at))
+            affected.add((groups[group], disciplines[discipline], sessions[session]))
+            tags.update(grade_tags(student_id, groups[group], disciplines[discipline]))
+            if len(pending) >= TRANSACTION_SIZE:
+                _write(pending, teacher_id)
+                imported += len(pending)
+                pending = []
+                if progress is not None:
+                    progress(imported + len(errors), None)
+        if pending:
+            _write(pending, teacher_id)
+            imported += len(pending)
+    finally:
+        # при остановке из progress уже записанные пачки тоже должны попасть в агрегаты и кэш
+        if affected:
+            grade_stats.recompute(affected)
+        response_cache.invalidate(tags)
+    return imported, errors
@@ -0,0 +1,115 @@
+import base64, json
+from datetime import datetime, timedelta
+from peewee import Tuple
+from database.db import User, Group, Student, Disciplines, SessionPeriod, Grade
+from services.name_index import name_index
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, UnicodeDecodeError):
+        raise CursorError("Неверный курсор")
+    if not isinstance(values, list) or len(values) != 2:
+        raise CursorError("Неверный курсор")
+    return values
+
+
+def _keyset(order, cursor):
+    """Условие "после курсора" и сортировка; у обеих id последним, поэтому порядок строгий."""
+    descending = order.startswith("-")
+    if order.lstrip("-") == "id":
+        key, columns = Grade.id, (Grade.id,)
+    else:
+        key, columns = Tuple(Grade.created_at, Grade.id), (Grade.created_at, Grade.id)
+    ordering = [column.desc() if descending else column for column in columns]
+    if cursor is None:
+        return None, ordering
+    value, grade_id = decode_cursor(cursor)
+    if order.lstrip("-") == "id":
+        after = grade_id
+    else:
+        try:
+            after = Tuple(datetime.fromisoformat(value), grade_id)
+        except (TypeError, ValueError):
+            raise CursorError("Неверный курсор")
+    return (key < after) if descending else (key > after), ordering
+
+
+def list_grades(page, group=None, student_id=None, discipline_id=None):
+    """Страница оценок и курсор следующей (None на последней).
+
+    Фильтры по названиям сводятся к id подзапросами, чтобы сама выборка шла по индексам
+    grade, а страница продолжалась с курсора (keyset), без OFFSET: глубокие страницы
+    стоят столько же, сколько первая.
+    """
+    teacher_user = User.alias()
+    query = (Grade
+             .select(Grade.id, Group.name, User.last_name, User.first_name, User.middle_name,
+                     Disciplines.name, SessionPeriod.name_session, Grade.grade,
+                     teacher_user.last_name, teacher_user.first_name, teacher_user.middle_name,
+                     Grade.created_at)
+             .join(Student)
+             .join(User)
+             .switch(Student)
+             .join(Group)
+             .switch(Grade)
+             .join(Disciplines)
+             .switch(Grade)
+             .join(SessionPeriod)
+             .switch(Grade)
+             .join(teacher_user, on=(Grade.teacher == teacher_user.id)))
+    if group is not None:
+        query = query.where(Grade.student.in_(Student.select(Student.id).where(Student.group == group)))
+    if student_id is not None:
+        query = query.where(Grade.student == student_id)
+    if discipline_id is not None:
+        query = query.where(Grade.discipline == discipline_id)
+    if page.discipline is not None:
+        query = query.where(Grade.discipline.in_(
+            Disciplines.select(Disciplines.id).where(Disciplines.name == page.discipline)))
+    if page.session is not None:
+        query = query.where(Grade.session.in_(
+            SessionPeriod.select(SessionPeriod.id).where(SessionPeriod.name_session == page.session)))
+    if page.teacher is not None:
+        query = query.where(Grade.teacher.in_([entry.user_id for entry in name_index.lookup(page.teacher)]))
+    if page.date_from is not None:
+        query = query.where(Grade.created_at >= datetime.combine(page.date_from, datetime.min.time()))
+    if page.date_to is not None:
+        query = query.where(Grade.created_at < datetime.combine(page.date_to + timedelta(days=1),
+                                                                datetime.min.time()))
+    after, ordering = _keyset(page.order, page.cursor)
+    if after is not None:
+        query = query.where(after)
+    # лишняя строка показывает, есть ли следующая страница
+    rows = list(query.order_by(*ordering).limit(page.limit + 1).tuples())
+
+    items = []
+    for (grade_id, group_name, last_name, first_name, middle_name, discipline, session, grade,
+         t_last_name, t_first_name, t_middle_name, created_at) in rows[:page.limit]:
+        info = dict()
+        info["id"] = grade_id
+        info["Группа"] = group_name
+        info["Студент"] = f"{last_name} {first_name} {middle_name}"
+        info["Дисциплина"] = discipline
+        info["Сессия"] = session
+        info["Оценка"] = grade
+        info["Учитель"] = f"{t_last_name} {t_first_name} {t_middle_name}"
+        info["Дата"] = created_at
+        items.append(info)
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        last = rows[page.limit - 1]
+        created_at = last[-1]
+        value = created_at.isoformat(" ") if isinstance(created_at, datetime) else created_at
+        next_cursor = encode_cursor([value, last[0]])
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,65 @@
+from peewee import Case, EXCLUDED, Tuple, chunked, fn
+from database.db import db, Student, Disciplines, Grade, GradeStats
+
+BUCKETS = (2, 3, 4, 5)
+COUNTERS = ["graded", "grade_sum"] + [f"count_{value}" for value in BUCKETS]
+
+
+def apply_changes(changes):
+    """Применяет изменения оценок к агрегатам одним upsert.
+
+    changes — список (group_id, discipline_id, session_id, старая оценка, новая оценка),
+    отсутствующая оценка передается как None. Вызывается в той же транзакции, что и запись Grade.
+    """
+    deltas = dict()
+    for group_id, discipline_id, session_id, old, new in changes:
+        delta = deltas.setdefault((group_id, discipline_id, session_id), dict.fromkeys(COUNTERS, 0))
+        for value, sign in ((old, -1), (new, 1)):
+            if value is None:
+                continue
+            delta["graded"] += sign
+            delta["grade_sum"] += sign * value
+            if value in BUCKETS:
+                delta[f"count_{value}"] += sign
+    rows = [
+        dict(group=group_id, discipline=discipline_id, session=session_id, **delta)
+        for (group_id, discipline_id, session_id), delta in deltas.items()
+        if any(delta.values())
+    ]
+    update = {getattr(GradeStats, name): getattr(GradeStats, name) + getattr(EXCLUDED, name)
+              for name in COUNTERS}
+    with db.atomic():
+        for batch in chunked(rows, 100):
+            (GradeStats
+             .insert_many(batch)
+             .on_conflict(
+                 conflict_target=[GradeStats.group, GradeStats.discipline, GradeStats.session],
+                 update=update)
+             .execute())
+
+
+def recompute(keys=None):
+    """Пересчитывает агрегаты из Grade: все, либо только для ключей (group_id, discipline_id, session_id)."""
+    query = (Grade
+             .select(Student.group, Grade.discipline, Grade.session,
+                     fn.COUNT(Grade.grade), fn.COALESCE(fn.SUM(Grade.grade), 0),
+                     *[fn.SUM(Case(None, [(Grade.grade == value, 1)], 0)) for value in BUCKETS])
+             .join(Student)
+             .join_from(Grade, Disciplines)
+             .group_by(Student.group, Grade.discipline, Grade.session))
+    fields = [GradeStats.group, GradeStats.discipline, GradeStats.session, GradeStats.graded,
+              GradeStats.grade_sum] + [getattr(GradeStats, f"count_{value}") for value in BUCKETS]
+    with db.atomic():
+        if keys is None:
+            GradeStats.delete().execute()
+            GradeStats.insert_from(query, fields).execute()
+            return
+        for batch in chunked(list(keys), 300):
+            (GradeStats
+             .delete()
+             .where(Tuple(GradeStats.group, GradeStats.discipline, GradeStats.session).in_(batch))
+             .execute())
+            (GradeStats
+             .insert_from(query.where(Tuple(Student.group, Grade.discipline, Grade.session).in_(batch)),
+                          fields)
+             .execute())
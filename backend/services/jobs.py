@@ -0,0 +1,241 @@
+import json, os, shutil, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from config import settings
+from database.db import db, DATABASE_PATH, Job
+from services import analytics, grade_export, grade_history, grade_import, onboarding
+
+JOB_DIR = Path(settings.job_dir) if settings.job_dir else DATABASE_PATH.parent / "jobs"
+ACTIVE = ("queued", "running")
+# прогресс пишется в базу не чаще, чем раз в столько секунд
+PROGRESS_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobRun:
+    """Выполняющаяся задача: прогресс и проверка отмены через строку Job.
+
+    Отмена — это status="cancelled", выставленный любым процессом; обновление прогресса
+    идет с условием status="running" и, не найдя строки, останавливает задачу.
+    """
+
+    def __init__(self, job_id, params):
+        self.id = job_id
+        self.params = params
+        self.done = 0
+        self.total = None
+        self.files = []
+        self._reported = 0.0
+
+    def path(self, suffix):
+        path = JOB_DIR / f"{self.id}-{uuid.uuid4().hex}{suffix}"
+        self.files.append(path)
+        return path
+
+    def progress(self, done, total=None):
+        self.done, self.total = done, total
+        now = time.monotonic()
+        if now - self._reported < PROGRESS_INTERVAL:
+            return
+        self._reported = now
+        updated = (Job
+                   .update(done=done, total=total)
+                   .where((Job.id == self.id) & (Job.status == "running"))
+                   .execute())
+        if not updated:
+            raise JobCancelled
+
+
+def _export(run):
+    params = run.params
+    path = run.path(".csv" if params["format"] == "csv" else ".ndjson")
+    count = grade_export.export_to_file(path, params["format"], run.progress, group=params.get("group"),
+                                        session=params.get("session"), discipline=params.get("discipline"))
+    media_type = "text/csv; charset=utf-8" if params["format"] == "csv" else "application/x-ndjson"
+    return path, media_type, f"Выгружено {count} оценок"
+
+
+def _import_grades(run):
+    with open(run.params["input"], "rb") as file:
+        imported, errors = grade_import.import_grades(file, run.params["teacher_id"], run.progress)
+    path = _write_json(run, {"imported_count": imported, "errors": errors})
+    return path, "application/json", f"Импортировано {imported} оценок, ошибок: {len(errors)}"
+
+
+def _onboard(run):
+    with open(run.params["input"], "rb") as file:
+        created, results = onboarding.onboard(onboarding.read_people(file))
+    errors = sum(1 for result in results if "Ошибка" in result)
+    path = _write_json(run, {"created_count": created, "results": results})
+    return path, "application/json", f"Создано {created} пользователей, ошибок: {errors}"
+
+
+def _report(run):
+    session = run.params.get("session")
+    report = analytics.build_report(session)
+    # следующий запрос к /reports получит уже готовый отчет
+    analytics.report_cache.set(session, report)
+    path = _write_json(run, report)
+    return path, "application/json", f"Студентов в отчете: {len(report['students'])}"
+
+
+def _compact_history(run):
+    moved = grade_history.compact_closed(run.progress)
+    path = _write_json(run, {"moved_count": moved})
+    return path, "application/json", f"Перенесено в архив изменений: {moved}"
+
+
+def _write_json(run, data):
+    path = run.path(".json")
+    path.write_text(json.dumps(data, ensure_ascii=False, default=str), encoding="utf-8")
+    return path
+
+
+HANDLERS = {
+    "export": _export,
+    "import_grades": _import_grades,
+    "onboard": _onboard,
+    "report": _report,
+    "compact_history": _compact_history,
+}
+
+
+class JobQueue:
+    """Очередь фоновых задач в пуле потоков процесса, состояние — в таблице Job.
+
+    Потоки, а не процессы: импорт и создание пользователей обновляют индекс имен
+    и кэши этого процесса, а bcrypt и SQLite и так отпускают GIL.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=settings.job_workers,
+                                                    thread_name_prefix="job")
+            return self._executor
+
+    def submit(self, kind, owner_id, params, upload=None) -> Job:
+        """Ставит задачу в очередь; upload — файл запроса, копируется в JOB_DIR до ответа."""
+        JOB_DIR.mkdir(parents=True, exist_ok=True)
+        params = dict(params)
+        if upload is not None:
+            path = JOB_DIR / f"input-{uuid.uuid4().hex}.csv"
+            with open(path, "wb") as file:
+                shutil.copyfileobj(upload, file)
+            params["input"] = str(path)
+        job = Job.create(kind=kind, owner=owner_id, params=json.dumps(params, ensure_ascii=False),
+                         pid=os.getpid())
+        self._pool().submit(self._run, job.id)
+        return job
+
+    def _run(self, job_id):
+        # как db_connection у запроса: свое состояние соединения на задачу,
+        # соединение возвращается в пул после нее
+        db._state.activate()
+        try:
+            self._execute(job_id)
+            # старые результаты удаляются и в долго работающем процессе, не только при старте
+            self.purge_expired()
+        finally:
+            if not db.is_closed():
+                db.close()
+
+    def _execute(self, job_id):
+        started = (Job
+                   .update(status="running", started_at=datetime.now())
+                   .where((Job.id == job_id) & (Job.status == "queued"))
+                   .execute())
+        job = Job.get_by_id(job_id)
+        params = json.loads(job.params)
+        if not started:
+            # отменена, пока ждала в очереди
+            _remove(params.get("input"))
+            return
+        run = JobRun(job_id, params)
+        try:
+            path, media_type, message = HANDLERS[job.kind](run)
+        except JobCancelled:
+            self._finish(job_id, None, dict())
+        except Exception as e:
+            self._finish(job_id, None, dict(status="failed", message=f"{type(e).__name__}: {e}"))
+        else:
+            self._finish(job_id, path, dict(status="done", message=message, result_file=str(path),
+                                            media_type=media_type, done=run.done, total=run.total))
+            return
+        finally:
+            _remove(params.get("input"))
+        # недописанный результат отмененной или упавшей задачи
+        for path in run.files:
+            _remove(path)
+
+    def _finish(self, job_id, path, fields):
+        updated = (Job
+                   .update(finished_at=datetime.now(), **fields)
+                   .where((Job.id == job_id) & (Job.status == "running"))
+                   .execute())
+        if not updated:
+            # отменена, пока выполнялась: результат не нужен
+            Job.update(finished_at=datetime.now()).where(Job.id == job_id).execute()
+            _remove(path)
+
+    def cancel(self, job) -> bool:
+        """Отменяет задачу в очереди или выполняющуюся; False, если она уже завершилась."""
+        return bool(Job
+                    .update(status="cancelled", message="Задача отменена")
+                    .where((Job.id == job.id) & (Job.status.in_(ACTIVE)))
+                    .execute())
+
+    def recover(self):
+        """При старте: задачи, чей процесс завершился, помечаются failed; старые результаты удаляются."""
+        with db.connection_context():
+            for job in Job.select().where(Job.status.in_(ACTIVE)):
+                if job.pid is None or not _alive(job.pid) or job.pid == os.getpid():
+                    job.status = "failed"
+                    job.message = "Процесс, выполнявший задачу, перезапущен"
+                    job.finished_at = datetime.now()
+                    job.save()
+                    _remove(json.loads(job.params).get("input"))
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Удаляет завершенные задачи старше job_result_ttl_hours вместе с файлами результатов."""
+        expired = datetime.now() - timedelta(hours=settings.job_result_ttl_hours)
+        old = list(Job
+                   .select(Job.id, Job.result_file)
+                   .where(Job.status.not_in(ACTIVE) & (Job.created_at < expired)))
+        for job in old:
+            _remove(job.result_file)
+        if old:
+            Job.delete().where(Job.id.in_([job.id for job in old])).execute()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove(path):
+    if path:
+        Path(path).unlink(missing_ok=True)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,108 @@
+import threading
+from typing import NamedTuple
+from peewee import JOIN, chunked
+from database.db import db, User, Role, Student, normalize_name
+
+
+class NameEntry(NamedTuple):
+    user_id: int
+    role: str
+    student_id: int | None
+    group_id: int | None
+    full_name: str
+
+
+class NameIndex:
+    """Индекс ФИО -> пользователи в памяти процесса.
+
+    Ключ — User.name_key (регистр и ё/е сведены). Под одним ключом может быть
+    несколько пользователей (однофамильцы-тезки). Запись, сделанная другим процессом,
+    подтягивается из базы при промахе или если найденные записи не подошли (refresh).
+    """
+
+    def __init__(self):
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+    def _query(self):
+        return (User
+                .select(User.id, Role.name, Student.id, Student.group,
+                        User.last_name, User.first_name, User.middle_name, User.name_key)
+                .join(Role)
+                .switch(User)
+                .join(Student, JOIN.LEFT_OUTER)
+                .order_by(User.id)
+                .tuples())
+
+    def _fill(self, rows, keys=()):
+        entries = {key: [] for key in keys}
+        for user_id, role, student_id, group_id, last_name, first_name, middle_name, name_key in rows:
+            entries.setdefault(name_key, []).append(
+                NameEntry(user_id, role, student_id, group_id, f"{last_name} {first_name} {middle_name}"))
+        with self._lock:
+            for key, found in entries.items():
+                if found:
+                    self._entries[key] = found
+                else:
+                    self._entries.pop(key, None)
+
+    def load(self):
+        with db.connection_context():
+            rows = list(self._query())
+        with self._lock:
+            self._entries.clear()
+        self._fill(rows)
+
+    def lookup(self, full_name, refresh=False) -> list[NameEntry]:
+        return self.lookup_many([full_name], refresh)[normalize_name(full_name)]
+
+    def lookup_many(self, full_names, refresh=False) -> dict[str, list[NameEntry]]:
+        """Записи для каждого ФИО по нормализованному ключу; промахи добираются одним запросом на пачку."""
+        keys = list(dict.fromkeys(normalize_name(full_name) for full_name in full_names))
+        missing = keys if refresh else [key for key in keys if key not in self._entries]
+        # без connection_context: поиск бывает внутри транзакции эндпоинта
+        for batch in chunked(missing, 300):
+            self._fill(self._query().where(User.name_key.in_(batch)), batch)
+        return {key: list(self._entries.get(key, ())) for key in keys}
+
+    def find_all(self, full_name, match, refresh=False) -> list[NameEntry]:
+        """Все записи, для которых match(entry) истинно; если в индексе таких нет, ключ перечитывается из базы.
+
+        refresh=True сразу читает ключ из базы: так видны и тезки, добавленные другим процессом.
+        """
+        # промах индекса и так читается из базы, перечитывать нужно только найденное в памяти
+        if refresh:
+            passes = (True,)
+        elif normalize_name(full_name) in self._entries:
+            passes = (False, True)
+        else:
+            passes = (False,)
+        for refresh in passes:
+            found = [entry for entry in self.lookup(full_name, refresh) if match(entry)]
+            if found:
+                return found
+        return []
+
+    def find(self, full_name, match) -> NameEntry | None:
+        """Первая запись, для которой match(entry) истинно."""
+        found = self.find_all(full_name, match)
+        return found[0] if found else None
+
+    def students(self, full_name, group_id) -> list[NameEntry]:
+        """Студенты группы с этим ФИО; больше одного — тезки, которых по имени не различить."""
+        return self.find_all(full_name, lambda entry: entry.student_id is not None and entry.group_id == group_id)
+
+    def add(self, user: User, role: str, student_id=None, group_id=None):
+        entry = NameEntry(user.id, role, student_id, group_id,
+                          f"{user.last_name} {user.first_name} {user.middle_name}")
+        with self._lock:
+            found = self._entries.setdefault(user.name_key, [])
+            if all(other.user_id != user.id for other in found):
+                found.append(entry)
+
+    def homonyms(self) -> dict[str, list[NameEntry]]:
+        with self._lock:
+            return {key: list(found) for key, found in self._entries.items() if len(found) > 1}
+
+
+name_index = NameIndex()
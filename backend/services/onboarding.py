@@ -0,0 +1,128 @@
+from peewee import chunked
+from cache import response_cache, group_member_tags
+from database.db import (write_atomic, password_executor, hash_password, normalize_name,
+                         Role, User, Group, Disciplines, Student, Teacher)
+from instrumentation import with_request_stats
+from services.grade_import import read_rows
+from services.name_index import name_index
+
+COLUMNS = ("name", "role", "group", "discipline", "password")
+DEFAULT_PASSWORD = "123"
+STUDENT, TEACHER = "Студент", "Преподаватель"
+
+
+def read_people(binary_file):
+    """Читает CSV с колонками name (ФИО), role и необязательными group, discipline, password."""
+    rows = read_rows(binary_file, COLUMNS, optional=("group", "discipline", "password"))
+    for line, (name, role, group, discipline, password) in rows:
+        parts = name.split()
+        if len(parts) != 3:
+            # неверное имя попадет в отчет как ошибка строки
+            parts = [name, "", ""]
+        last_name, first_name, middle_name = parts
+        yield line, dict(last_name=last_name, first_name=first_name, middle_name=middle_name,
+                         role=role, group=group or None, discipline=discipline or None,
+                         password=password or None)
+
+
+def _check(person, key, groups, disciplines, existing, seen):
+    if not (person["last_name"] and person["first_name"] and person["middle_name"]):
+        return "Неверный формат имени"
+    role = person["role"]
+    if role == STUDENT:
+        if not person["group"]:
+            return "Для студента нужна группа"
+        if person["group"] not in groups:
+            return f"Группа {person['group']} не найдена"
+    elif role == TEACHER:
+        if not person["discipline"]:
+            return "Для преподавателя нужна дисциплина"
+        if person["discipline"] not in disciplines:
+            return f"Дисциплина {person['discipline']} не найдена"
+        if not person["password"]:
+            return "Для преподавателя нужен пароль"
+    else:
+        return f"Неизвестная роль: {role}"
+    if (key, role) in seen or any(entry.role == role for entry in existing[key]):
+        return "Пользователь с такими данными уже существует"
+    return None
+
+
+def onboard(people):
+    """Создает студентов и преподавателей пачкой.
+
+    people — пары (номер строки, словарь с полями OnboardPerson). Дубликаты ищутся одним
+    запросом на пачку имен, пароли хэшируются параллельно, пользователи и профили
+    вставляются insert_many в одной транзакции. Возвращает число созданных и результат по строкам.
+    """
+    people = list(people)
+    groups = dict(Group.select(Group.name, Group.id).tuples())
+    disciplines = dict(Disciplines.select(Disciplines.name, Disciplines.id).tuples())
+    roles = dict(Role.select(Role.name, Role.id).tuples())
+    full_names = [" ".join(filter(None, (person["last_name"], person["first_name"], person["middle_name"])))
+                  for _, person in people]
+    existing = name_index.lookup_many(full_names, refresh=True)
+
+    results = []
+    accepted = []
+    seen = set()
+    for (row, person), full_name in zip(people, full_names):
+        key = normalize_name(full_name)
+        result = {"row": row, "ФИО": full_name, "Роль": person["role"]}
+        results.append(result)
+        error = _check(person, key, groups, disciplines, existing, seen)
+        if error is not None:
+            result["Статус"] = "ошибка"
+            result["Ошибка"] = error
+            continue
+        seen.add((key, person["role"]))
+        accepted.append((result, person, key))
+    if not accepted:
+        return 0, results
+
+    # bcrypt отпускает GIL, поэтому пул потоков считает хэши на всех ядрах
+    passwords = [person["password"] or DEFAULT_PASSWORD for _, person, _ in accepted]
+    hashes = list(password_executor.map(with_request_stats(hash_password), passwords))
+
+    users = [
+        dict(last_name=person["last_name"], first_name=person["first_name"],
+             middle_name=person["middle_name"], password_hash=password_hash,
+             role=roles[person["role"]], name_key=key)
+        for (_, person, key), password_hash in zip(accepted, hashes)
+    ]
+    with write_atomic():
+        for batch in chunked(users, 100):
+            User.insert_many(batch).execute()
+        # пара (name_key, роль) уникальна после проверки дубликатов, по ней находятся новые id
+        user_ids = dict()
+        for batch in chunked(list({key for _, _, key in accepted}), 300):
+            rows = (User
+                    .select(User.id, User.name_key, User.role)
+                    .where(User.name_key.in_(batch))
+                    .tuples())
+            for user_id, key, role_id in rows:
+                user_ids[(key, role_id)] = user_id
+        for result, person, key in accepted:
+            result["user_id"] = user_ids[(key, roles[person["role"]])]
+
+        students = [dict(user=result["user_id"], group=groups[person["group"]])
+                    for result, person, _ in accepted if person["role"] == STUDENT]
+        teachers = [dict(user=result["user_id"], discipline=disciplines[person["discipline"]])
+                    for result, person, _ in accepted if person["role"] == TEACHER]
+        for batch in chunked(students, 100):
+            Student.insert_many(batch).execute()
+        for batch in chunked(teachers, 100):
+            Teacher.insert_many(batch).execute()
+        student_ids = dict()
+        for batch in chunked([student["user"] for student in students], 300):
+            student_ids.update(Student.select(Student.user, Student.id).where(Student.user.in_(batch)).tuples())
+
+    for result, person, key in accepted:
+        result["Статус"] = "создан"
+        user = User(id=result["user_id"], last_name=person["last_name"], first_name=person["first_name"],
+                    middle_name=person["middle_name"], name_key=key)
+        group_id = groups[person["group"]] if person["role"] == STUDENT else None
+        name_index.add(user, person["role"], student_ids.get(user.id), group_id)
+    group_ids = {groups[person["group"]] for _, person, _ in accepted if person["role"] == STUDENT}
+    response_cache.invalidate([tag for group_id in group_ids for tag in group_member_tags(group_id)])
+    return len(accepted), results
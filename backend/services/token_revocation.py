@@ -0,0 +1,80 @@
+import asyncio, peewee, threading
+from datetime import datetime, timezone
+from fastapi.concurrency import run_in_threadpool
+from config import settings
+from database.db import db, RevokedToken
+
+
+def utcnow() -> datetime:
+    # в базе и в памяти время истечения хранится без зоны, в UTC, как exp в JWT
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def expires_at(exp) -> datetime:
+    return datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+
+class RevocationList:
+    """Отозванные jti в памяти процесса, сохраняются в таблицу RevokedToken.
+
+    Проверка — поиск в dict. Отзывы, сделанные другими процессами, подтягиваются
+    sync() по возрастанию id, истекшие токены забываются.
+    """
+
+    def __init__(self):
+        self._expires = dict()
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, jti) -> bool:
+        return jti in self._expires
+
+    def revoke(self, jti, exp) -> bool:
+        """Отзывает jti; False, если его уже отозвал этот или другой процесс.
+
+        Вставка с on_conflict_ignore атомарна: из параллельных отзывов одного jti
+        строку вставит только один, по rowcount он и узнает об этом.
+        """
+        expires = expires_at(exp)
+        with db.connection_context():
+            inserted = (RevokedToken
+                        .insert(jti=jti, expires_at=expires)
+                        .on_conflict_ignore()
+                        .as_rowcount()
+                        .execute())
+        with self._lock:
+            self._expires[jti] = expires
+        return bool(inserted)
+
+    def sync(self):
+        """Загружает новые отзывы из базы и удаляет истекшие."""
+        now = utcnow()
+        with db.connection_context():
+            rows = (RevokedToken
+                    .select(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)
+                    .where(RevokedToken.id > self._last_id)
+                    .order_by(RevokedToken.id)
+                    .tuples())
+            with self._lock:
+                for row_id, jti, expires in rows:
+                    self._expires[jti] = expires
+                    self._last_id = row_id
+                expired = [jti for jti, expires in self._expires.items() if expires < now]
+                for jti in expired:
+                    del self._expires[jti]
+            # пустой DELETE в SQLite тоже берет блокировку записи, поэтому только если есть что удалять
+            if expired:
+                RevokedToken.delete().where(RevokedToken.expires_at < now).execute()
+
+
+revoked_tokens = RevocationList()
+
+
+async def sync_periodically():
+    while True:
+        await asyncio.sleep(settings.revocation_sync_seconds)
+        try:
+            await run_in_threadpool(revoked_tokens.sync)
+        except peewee.OperationalError:
+            # база занята; следующая попытка через revocation_sync_seconds
+            continue
@@ -0,0 +1,57 @@
+"""Общие фикстуры: новая SQLite из benchmarks.data на каждый тест, приложение через TestClient.
+
+Запуск из каталога backend: python -m pytest -q
+"""
+import os, sys, tempfile
+from pathlib import Path
+
+# до импорта config: быстрый bcrypt, кэши в процессе, результаты задач во временном каталоге
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ.setdefault("JOB_DIR", tempfile.mkdtemp(prefix="jobs-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+from fastapi.testclient import TestClient
+from benchmarks.data import generate, PASSWORD
+from cache import user_cache, principal_cache, token_version_cache, response_cache
+from database.db import db
+from database.migrations import run_migrations
+from services.name_index import name_index
+
+GROUP = "Группа 1"
+TEACHER = "Преподаватель1 Имя Отчество"
+ADMIN = "Админ Админ Админ"
+# benchmarks.data: студенты начинаются с user_id = дисциплин + 2
+STUDENTS = ["Студент4 Имя0 Отчество1", "Студент5 Имя1 Отчество1", "Студент6 Имя2 Отчество1"]
+
+
+@pytest.fixture
+def database(tmp_path):
+    db.close_all()
+    db.init(str(tmp_path / "db.db"))
+    run_migrations()
+    generate(groups=2, students_per_group=3, disciplines=2, sessions=2)
+    # кэши и индекс имен процесса переживают смену базы между тестами
+    for cache in (user_cache, principal_cache, token_version_cache, response_cache):
+        cache.clear()
+    name_index.load()
+    yield db
+    db.close_all()
+
+
+@pytest.fixture
+def client(database):
+    from main import app
+    with TestClient(app) as client:
+        yield client
+
+
+def login(client, username, password=PASSWORD):
+    response = client.post("/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def auth(tokens):
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
@@ -0,0 +1,46 @@
+from services.analytics import GradeFrame, student_ranking, discipline_difficulty, session_trends
+
+STUDENTS = {1: "А", 2: "Б", 3: "В", 4: "Г"}
+GROUPS = {1: "Группа 1", 2: "Группа 2"}
+DISCIPLINES = {1: "Математика", 2: "История", 3: "Физика"}
+# порядок словаря — хронология сессий, id нарочно не по порядку
+SESSIONS = {7: "Зима", 3: "Лето"}
+
+# (студент, группа, дисциплина, сессия, оценка)
+ROWS = [
+    (1, 1, 1, 7, 5), (1, 1, 2, 7, 4),
+    (2, 1, 1, 7, 4), (2, 1, 2, 7, 5),
+    (3, 1, 1, 7, 3), (3, 1, 3, 3, 2),
+    (4, 2, 1, 7, 4), (4, 2, 2, 3, 5), (4, 2, 3, 3, 3),
+]
+
+
+def _frame():
+    return GradeFrame(ROWS, STUDENTS, GROUPS, DISCIPLINES, SESSIONS)
+
+
+def test_ranking_gives_ties_the_same_place():
+    ranking = {row["Студент"]: row for row in student_ranking(_frame())}
+    # А и Б по 4.5 делят первое место, следующий — третий
+    assert [ranking[name]["Место в группе"] for name in ("А", "Б", "В")] == [1, 1, 3]
+    assert ranking["В"]["Средний балл"] == 2.5
+    assert ranking["В"]["Двоек"] == 1
+    # места считаются внутри группы
+    assert ranking["Г"]["Место в группе"] == 1
+
+
+def test_disciplines_ordered_from_hardest():
+    difficulty = discipline_difficulty(_frame())
+    assert [row["Дисциплина"] for row in difficulty] == ["Физика", "Математика", "История"]
+    assert difficulty[0]["Доля двоек"] == 0.5
+    assert difficulty[1]["Средний балл"] == 4.0
+
+
+def test_trend_delta_follows_session_chronology():
+    trends = {row["Группа"]: row["Сессии"] for row in session_trends(_frame())}
+    assert trends["Группа 2"] == [
+        {"Сессия": "Зима", "Средний балл": 4.0, "Изменение": None},
+        {"Сессия": "Лето", "Средний балл": 4.0, "Изменение": 0.0},
+    ]
+    # пять оценок зимой (21 / 5), одна двойка летом
+    assert [(row["Средний балл"], row["Изменение"]) for row in trends["Группа 1"]] == [(4.2, None), (2.0, -2.2)]
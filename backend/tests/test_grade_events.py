@@ -0,0 +1,135 @@
+import asyncio, json, threading
+import pytest
+from config import settings
+from database.db import db, write_atomic, on_commit, Grade, SessionPeriod
+from services import grade_events
+from services.grade_events import GradeBroker, RESYNC, grade_messages, group_topic, student_topic
+from tests.conftest import GROUP, TEACHER, STUDENTS, login, auth
+
+
+def _messages(grade=5):
+    return grade_messages(1, 1, "Дисциплина 1", "Сессия 2", [(1, STUDENTS[0], grade), (2, STUDENTS[1], 4)], 2)
+
+
+def _data(text):
+    event, data = text.strip().split("\n")
+    assert event == "event: grades"
+    return json.loads(data.removeprefix("data: "))
+
+
+async def _drain():
+    # publish передает сообщения в loop через call_soon_threadsafe
+    await asyncio.sleep(0)
+
+
+def test_subscribe_publish():
+    async def scenario():
+        broker = GradeBroker()
+        broker.start(asyncio.get_running_loop())
+        group = broker.subscribe([group_topic(1, 1)])
+        student = broker.subscribe([student_topic(1)])
+        other = broker.subscribe([student_topic(3)])
+        assert broker.connections == 3
+
+        broker.publish(_messages())
+        await _drain()
+        assert [item["grade"] for item in _data(group.queue.get_nowait())["grades"]] == [5, 4]
+        assert _data(student.queue.get_nowait())["grades"] == [dict(student_id=1, student=STUDENTS[0], grade=5)]
+        assert other.queue.empty()
+
+        broker.unsubscribe(student)
+        broker.publish(_messages(3))
+        await _drain()
+        assert student.queue.empty()
+        assert broker.connections == 2
+
+    asyncio.run(scenario())
+
+
+def test_publish_only_after_commit(database):
+    async def scenario():
+        broker = GradeBroker()
+        broker.start(asyncio.get_running_loop())
+        subscription = broker.subscribe([group_topic(1)])
+        with pytest.raises(RuntimeError):
+            with write_atomic():
+                on_commit(lambda: broker.publish(_messages(2)))
+                raise RuntimeError
+        with write_atomic():
+            on_commit(lambda: broker.publish(_messages(3)))
+            await _drain()
+            assert subscription.queue.empty()
+        await _drain()
+        assert [item["grade"] for item in _data(subscription.queue.get_nowait())["grades"]] == [3, 4]
+        assert subscription.queue.empty()
+
+    asyncio.run(scenario())
+
+
+def _committed_grade():
+    """Оценка студента 1 из отдельного соединения, которому видно только закоммиченное."""
+    result = []
+
+    def read():
+        with db.connection_context():
+            session_id = SessionPeriod.get(SessionPeriod.is_active == True).id
+            result.append(Grade.get((Grade.student == 1) & (Grade.discipline == 1) &
+                                    (Grade.session == session_id)).grade)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_endpoint_publishes_committed_grades(client, monkeypatch):
+    seen = []
+    monkeypatch.setattr(grade_events.grade_broker, "publish",
+                        lambda messages: seen.append((_committed_grade(), dict(messages))))
+    new_grade = 2 if _committed_grade() != 2 else 3
+    response = client.patch(f"/teacher/mass-grades/{GROUP}", headers=auth(login(client, TEACHER)),
+                            json={"group_name": GROUP, "students": [STUDENTS[0]], "grades": [new_grade]})
+    assert response.status_code == 200, response.text
+    (grade, messages), = seen
+    assert grade == new_grade
+    assert _data(messages[student_topic(1)])["grades"][0]["grade"] == new_grade
+
+
+def test_overflow_sends_resync(monkeypatch):
+    monkeypatch.setattr(settings, "grade_events_queue_size", 2)
+
+    async def scenario():
+        broker = GradeBroker()
+        broker.start(asyncio.get_running_loop())
+        slow = broker.subscribe([student_topic(1)])
+        for grade in (2, 3, 4):
+            broker.publish(_messages(grade))
+        await _drain()
+        # очередь очищена, подписчик отключен и получает только RESYNC
+        assert slow.queue.get_nowait() is RESYNC
+        assert slow.queue.empty()
+        assert broker.connections == 0
+        broker.publish(_messages(5))
+        await _drain()
+        assert slow.queue.empty()
+
+    asyncio.run(scenario())
+
+
+def test_stream_ends_after_resync(monkeypatch):
+    monkeypatch.setattr(settings, "grade_events_queue_size", 1)
+
+    async def scenario():
+        broker = GradeBroker()
+        broker.start(asyncio.get_running_loop())
+        stream = broker.stream([student_topic(1)])
+        assert (await anext(stream)).startswith("retry:")
+        broker.publish(_messages(2))
+        broker.publish(_messages(3))
+        await _drain()
+        assert await anext(stream) is RESYNC
+        with pytest.raises(StopAsyncIteration):
+            await anext(stream)
+        assert broker.connections == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from database.db import Grade, GradeChange, GradeHistoryArchive
+from services import grade_history
+from tests.conftest import ADMIN, login, auth
+
+START = datetime(2026, 1, 10, 9, 0)
+QUERIES = [
+    dict(),
+    dict(limit=3),
+    dict(student_ids=[1], limit=5),
+    dict(user_ids=[2]),
+    dict(user_ids=[3], student_ids=[2]),
+    dict(date_from=START + timedelta(hours=5)),
+    dict(date_to=START + timedelta(hours=7), limit=4),
+    dict(date_from=START + timedelta(hours=2), date_to=START + timedelta(hours=9), limit=2),
+    dict(session_id=1, limit=50),
+]
+
+
+def _record(offset, changes, changed_by):
+    for hour, change in enumerate(changes, start=offset):
+        grade_history.record([change], changed_by, grade_history.PUT_GRADE, START + timedelta(hours=hour))
+
+
+def _snapshot():
+    return [grade_history.history(**query) for query in QUERIES]
+
+
+def test_compaction_keeps_history(database):
+    # сессия 1 из benchmarks.data закрыта полгода назад
+    assert grade_history.compactable_sessions() == [1]
+    _record(0, [(1, 1, 1, 4, 5), (2, 1, 1, 3, 4), (1, 1, 1, 5, 3)], changed_by=2)
+    _record(3, [(1, 2, 1, 2, 3), (2, 2, 1, 4, 2), (2, 1, 1, 4, 5)], changed_by=3)
+    _record(6, [(1, 1, 1, 3, 4), (3, 1, 1, 2, 5), (1, 1, 2, 4, 5)], changed_by=2)
+    before = _snapshot()
+    assert len(before[0]) == 9
+
+    assert grade_history.compact(1) == 8
+    # в журнале остались только изменения активной сессии
+    assert GradeChange.select().count() == 1
+    assert _snapshot() == before
+
+    # поздние исправления после сжатия дописываются к строкам архива
+    _record(9, [(1, 1, 1, 4, 2), (2, 2, 1, 2, 3)], changed_by=3)
+    before = _snapshot()
+    assert grade_history.compact(1) == 2
+    assert _snapshot() == before
+    keys = list(GradeHistoryArchive
+                .select(GradeHistoryArchive.student_id, GradeHistoryArchive.discipline_id,
+                        GradeHistoryArchive.changed_by)
+                .tuples())
+    assert len(keys) == len(set(keys)) == 7
+
+
+def test_delete_discipline_records_deleted_grades(client):
+    grades = sorted(Grade.select(Grade.student, Grade.session, Grade.grade).where(Grade.discipline == 2).tuples())
+    assert grades
+    response = client.delete("/administrator/administrator/delete/Дисциплина 2", headers=auth(login(client, ADMIN)))
+    assert response.status_code == 200, response.text
+    changes = (GradeChange
+               .select(GradeChange.student_id, GradeChange.session_id, GradeChange.old_grade)
+               .where((GradeChange.discipline_id == 2) & (GradeChange.new_grade.is_null()) &
+                      (GradeChange.changed_by == 1) &
+                      (GradeChange.source == grade_history.DELETE_DISCIPLINE)))
+    assert sorted(changes.tuples()) == grades
@@ -0,0 +1,45 @@
+import pytest
+from database.db import Grade
+from services.grade_listing import encode_cursor
+from tests.conftest import ADMIN, STUDENTS, login, auth
+
+URL = "/administrator/administrator/grades_page/"
+
+
+def _walk(client, url, headers, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        response = client.get(url, headers=headers, params=query)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        ids += [item["id"] for item in body["items"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+@pytest.mark.parametrize("order", ["id", "-id", "created_at", "-created_at"])
+def test_cursor_walk_has_no_gaps_or_duplicates(client, order):
+    headers = auth(login(client, ADMIN))
+    ids, pages = _walk(client, URL, headers, limit=5, order=order)
+    assert len(ids) == len(set(ids))
+    assert sorted(ids) == sorted(grade.id for grade in Grade.select(Grade.id))
+    assert pages == -(-len(ids) // 5)
+    if order.lstrip("-") == "id":
+        assert ids == sorted(ids, reverse=order.startswith("-"))
+
+
+def test_student_page_walk(client):
+    headers = auth(login(client, STUDENTS[0]))
+    ids, _ = _walk(client, "/student/my_grades_page", headers, limit=1)
+    assert sorted(ids) == [grade.id for grade in Grade.select(Grade.id).where(Grade.student == 1).order_by(Grade.id)]
+
+
+@pytest.mark.parametrize("cursor", ["не-курсор", encode_cursor({"id": 1}), encode_cursor(["вчера", 1])])
+def test_bad_cursor_is_400(client, cursor):
+    response = client.get(URL, headers=auth(login(client, ADMIN)),
+                          params={"cursor": cursor, "order": "created_at"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Неверный курсор"
@@ -0,0 +1,63 @@
+from database.db import Grade, GradeStats, SessionPeriod
+from services import grade_stats
+from tests.conftest import GROUP, TEACHER, ADMIN, STUDENTS, login, auth
+
+
+def _snapshot():
+    return sorted(GradeStats.select(GradeStats.group, GradeStats.discipline, GradeStats.session,
+                                    GradeStats.graded, GradeStats.grade_sum, GradeStats.count_2,
+                                    GradeStats.count_3, GradeStats.count_4, GradeStats.count_5).tuples())
+
+
+def _assert_matches_recompute():
+    incremental = _snapshot()
+    grade_stats.recompute()
+    assert _snapshot() == incremental
+
+
+def _distribution(client):
+    response = client.get(f"/administrator/administrator/stats/{GROUP}", headers=auth(login(client, ADMIN)),
+                          params={"discipline": "Дисциплина 1", "session": "Сессия 2"})
+    assert response.status_code == 200, response.text
+    [row] = response.json()
+    return row["Оценок"], row["Распределение"]
+
+
+def _grades_in_group():
+    session_id = SessionPeriod.get(SessionPeriod.name_session == "Сессия 2").id
+    grades = [grade for grade, in (Grade
+                                   .select(Grade.grade)
+                                   .where((Grade.student.in_([1, 2, 3])) & (Grade.discipline == 1) &
+                                          (Grade.session == session_id))
+                                   .tuples())]
+    return len(grades), {str(value): grades.count(value) for value in grade_stats.BUCKETS}
+
+
+def test_generated_database_has_stats(database):
+    # 2 группы x 2 дисциплины x 2 сессии
+    assert len(_snapshot()) == 8
+    _assert_matches_recompute()
+
+
+def test_put_grade_updates_stats(client):
+    last_name, first_name, middle_name = STUDENTS[0].split()
+    current = _grades_in_group()
+    new_grade = 2 if current[1]["2"] == 0 else 5
+    response = client.patch("/put_grade", headers=auth(login(client, TEACHER)), json={
+        "last_name": last_name, "first_name": first_name, "middle_name": middle_name,
+        "group": GROUP, "discipline": "Дисциплина 1", "session": "Сессия 2", "grade": new_grade,
+    })
+    assert response.status_code == 200, response.text
+    assert _distribution(client) == _grades_in_group()
+    _assert_matches_recompute()
+
+
+def test_mass_grades_update_stats(client):
+    response = client.patch(f"/teacher/mass-grades/{GROUP}", headers=auth(login(client, TEACHER)), json={
+        "group_name": GROUP,
+        "students": [STUDENTS[0], STUDENTS[1], STUDENTS[2], STUDENTS[0]],
+        "grades": [2, 2, 3, 5],
+    })
+    assert response.status_code == 200, response.text
+    assert _distribution(client) == (3, {"2": 1, "3": 1, "4": 0, "5": 1})
+    _assert_matches_recompute()
@@ -0,0 +1,50 @@
+import io
+from database.db import Role, User, Student, Group, Grade, SessionPeriod
+from services import grade_import
+from services.name_index import name_index
+from tests.conftest import GROUP, TEACHER, ADMIN, STUDENTS, login, auth
+
+
+def _add_namesake():
+    """Второй студент с ФИО STUDENTS[0] в той же группе."""
+    last_name, first_name, middle_name = STUDENTS[0].split()
+    user = User(last_name=last_name, first_name=first_name, middle_name=middle_name,
+                role=Role.get(Role.name == "Студент"))
+    user.set_password("123")
+    user.save()
+    return user, Student.create(user=user, group=Group.get(Group.name == GROUP))
+
+
+def _put_grade(client, **extra):
+    last_name, first_name, middle_name = STUDENTS[0].split()
+    return client.patch("/put_grade", headers=auth(login(client, TEACHER)), json=dict(
+        last_name=last_name, first_name=first_name, middle_name=middle_name, group=GROUP,
+        discipline="Дисциплина 1", session="Сессия 2", grade=2, **extra))
+
+
+def test_put_grade_rejects_namesakes_in_group(client):
+    # добавлен другим процессом: в индексе этого его нет
+    user, profile = _add_namesake()
+    response = _put_grade(client)
+    assert response.status_code == 400
+    assert "несколько студентов" in response.json()["detail"]
+
+    # id берется из списка тезок
+    listing = client.get("/administrator/administrator/homonyms", headers=auth(login(client, ADMIN))).json()
+    ids = {entry["id"] for info in listing if info["ФИО"] == STUDENTS[0] for entry in info["Пользователи"]}
+    assert user.id in ids
+    response = _put_grade(client, user_id=user.id)
+    assert response.status_code == 200, response.text
+    session_id = SessionPeriod.get(SessionPeriod.name_session == "Сессия 2").id
+    assert Grade.get((Grade.student == profile.id) & (Grade.discipline == 1) & (Grade.session == session_id)).grade == 2
+
+
+def test_import_reports_namesakes_per_row(database):
+    user, profile = _add_namesake()
+    name_index.add(user, "Студент", profile.id, profile.group_id)
+    csv = ("student;group;discipline;session;grade\n"
+           f"{STUDENTS[0]};{GROUP};Дисциплина 1;Сессия 2;2\n"
+           f"{STUDENTS[1]};{GROUP};Дисциплина 1;Сессия 2;3\n")
+    imported, errors = grade_import.import_grades(io.BytesIO(csv.encode()), 1)
+    assert imported == 1
+    assert errors == [{"row": 2, "detail": f"В группе {GROUP} несколько студентов с именем {STUDENTS[0]}"}]
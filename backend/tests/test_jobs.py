@@ -0,0 +1,72 @@
+import csv, io, threading, time
+from database.db import Grade
+from services import jobs
+from services.jobs import job_queue
+from tests.conftest import ADMIN, login, auth
+
+URL = "/administrator/jobs"
+
+
+def _wait(client, headers, job_id, status, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        info = client.get(f"{URL}/{job_id}", headers=headers).json()
+        if info["status"] == status or time.monotonic() > deadline:
+            return info
+        time.sleep(0.02)
+
+
+class _Executor:
+    """Пул, который только запоминает задачи: тест сам решает, когда им выполняться."""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append((fn, args))
+
+
+def test_job_goes_queued_running_done(client, monkeypatch):
+    headers = auth(login(client, ADMIN))
+    executor = _Executor()
+    monkeypatch.setattr(job_queue, "_pool", lambda: executor)
+    release = threading.Event()
+
+    def handler(run):
+        release.wait(10)
+        run.done, run.total = 1, 1
+        return jobs._write_json(run, {"ok": True}), "application/json", "Готово"
+
+    monkeypatch.setitem(jobs.HANDLERS, "report", handler)
+    response = client.post(f"{URL}/report", headers=headers)
+    assert response.status_code == 200, response.text
+    job_id = response.json()["id"]
+    assert response.json()["status"] == "queued"
+    assert client.get(f"{URL}/{job_id}/result", headers=headers).status_code == 409
+
+    (fn, args), = executor.calls
+    worker = threading.Thread(target=fn, args=args)
+    worker.start()
+    assert _wait(client, headers, job_id, "running")["status"] == "running"
+    release.set()
+    worker.join(10)
+
+    info = _wait(client, headers, job_id, "done")
+    assert info["status"] == "done"
+    assert info["progress"] == 1.0
+    assert info["message"] == "Готово"
+    result = client.get(f"{URL}/{job_id}/result", headers=headers)
+    assert result.status_code == 200
+    assert result.json() == {"ok": True}
+
+
+def test_export_job_result(client):
+    headers = auth(login(client, ADMIN))
+    response = client.post(f"{URL}/export", headers=headers, params={"format": "csv"})
+    assert response.status_code == 200, response.text
+    info = _wait(client, headers, response.json()["id"], "done")
+    assert info["status"] == "done", info
+    result = client.get(f"{URL}/{info['id']}/result", headers=headers)
+    assert result.status_code == 200
+    rows = list(csv.reader(io.StringIO(result.text)))
+    assert len(rows) - 1 == Grade.select().count()
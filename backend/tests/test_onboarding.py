@@ -0,0 +1,40 @@
+from tests.conftest import GROUP, ADMIN, STUDENTS, login, auth
+
+CSV = ("name;role;group;discipline;password\n"
+       f"Новиков Иван Петрович;Студент;{GROUP};;\n"
+       f"Новиков Иван Петрович;Студент;{GROUP};;\n"
+       f"{STUDENTS[0]};Студент;{GROUP};;\n"
+       "Орлова Анна Сергеевна;Преподаватель;;Дисциплина 1;secret\n")
+
+
+def _onboard_csv(client, content):
+    return client.post("/administrator/onboard_csv/", headers=auth(login(client, ADMIN)),
+                       files={"file": ("people.csv", content.encode(), "text/csv")})
+
+
+def test_duplicate_rows_get_row_errors(client):
+    response = _onboard_csv(client, CSV)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["created_count"] == 2
+    statuses = {result["row"]: result["Статус"] for result in body["results"]}
+    assert statuses == {2: "создан", 3: "ошибка", 4: "ошибка", 5: "создан"}
+    errors = {result["row"]: result["Ошибка"] for result in body["results"] if "Ошибка" in result}
+    assert errors == {3: "Пользователь с такими данными уже существует",
+                      4: "Пользователь с такими данными уже существует"}
+
+
+def test_created_users_can_log_in(client):
+    response = client.post("/administrator/onboard/", headers=auth(login(client, ADMIN)), json=[
+        {"last_name": "Новиков", "first_name": "Иван", "middle_name": "Петрович",
+         "role": "Студент", "group": GROUP},
+        {"last_name": "Орлова", "first_name": "Анна", "middle_name": "Сергеевна",
+         "role": "Преподаватель", "discipline": "Дисциплина 1", "password": "secret"},
+    ])
+    assert response.status_code == 200, response.text
+    assert response.json()["created_count"] == 2
+
+    student = login(client, "Новиков Иван Петрович")
+    assert client.get("/student/my_grades", headers=auth(student)).status_code == 200
+    teacher = login(client, "Орлова Анна Сергеевна", "secret")
+    assert client.get(f"/teacher/grades/{GROUP}", headers=auth(teacher)).status_code == 200
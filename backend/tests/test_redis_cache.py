@@ -0,0 +1,87 @@
+import json, time
+import fakeredis
+import pytest
+from cache import RedisCache, RedisResponseCache
+from dependencies import auth_utils
+
+
+class _Request:
+    def __init__(self, etag=None):
+        self.headers = {"if-none-match": etag} if etag else {}
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+
+def test_get_set_and_ttl(client):
+    cache = RedisCache(client, "t:users:", ttl=1)
+    assert cache.get(1) is None
+    cache.set(1, {"id": 1, "role": "Студент", "groups": [1, 2]})
+    assert cache.get(1) == {"id": 1, "role": "Студент", "groups": [1, 2]}
+    assert 0 < client.ttl("t:users:1") <= 1
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    cache.set(2, 5)
+    time.sleep(1.1)
+    assert cache.get(2) is None
+    assert cache.stats() == {"backend": "redis", "hits": 1, "misses": 3}
+
+
+def test_values_are_json_not_pickle(client):
+    cache = RedisCache(client, "t:", ttl=60)
+    with pytest.raises(TypeError):
+        cache.set(1, object())
+    client.set("t:2", b"\x80\x04K\x01.")
+    # pickle в Redis не разбирается
+    with pytest.raises(ValueError):
+        cache.get(2)
+
+
+def test_cached_user_has_no_password_hash(database, client, monkeypatch):
+    monkeypatch.setattr(auth_utils, "user_cache", RedisCache(client, "t:users:", ttl=60))
+    assert auth_utils._cached_user(4).password_hash
+    stored = json.loads(client.get("t:users:4"))
+    assert "password_hash" not in stored
+    user = auth_utils._cached_user(4)
+    assert (user.id, user.last_name, user.role.name) == (4, "Студент4", "Студент")
+    assert user.password_hash is None
+
+
+def test_response_etag_and_304(client):
+    cache = RedisResponseCache(client, "t:responses:", max_bytes=1 << 20, ttl=60)
+    assert cache.respond(_Request(), ("my_grades", 4)) is None
+    response = cache.render(_Request(), ("my_grades", 4), [{"Оценка": 5}], [("student", 1)], cache.generation)
+    etag = response.headers["ETag"]
+    assert cache.respond(_Request(etag), ("my_grades", 4)).status_code == 304
+    cached = cache.respond(_Request('"other"'), ("my_grades", 4))
+    assert cached.status_code == 200
+    assert json.loads(cached.body) == [{"Оценка": 5}]
+
+
+def test_tag_invalidation_and_publish(client):
+    cache = RedisResponseCache(client, "t:responses:", max_bytes=1 << 20, ttl=60)
+    pubsub = client.pubsub()
+    pubsub.subscribe(cache.channel)
+    pubsub.get_message(timeout=1)
+    generation = cache.generation
+    cache.set(("a",), b"[1]", [("student", 1), ("group", 1)], generation)
+    cache.set(("b",), b"[2]", [("group", 2)], generation)
+    cache.invalidate([("student", 1)])
+    assert cache.get(("a",)) is None
+    assert cache.get(("b",))[0] == b"[2]"
+    message = pubsub.get_message(timeout=1)
+    assert json.loads(message["data"]) == [["student", 1]]
+
+
+def test_stale_generation_is_not_cached(client):
+    cache = RedisResponseCache(client, "t:responses:", max_bytes=1 << 20, ttl=60)
+    generation = cache.generation
+    cache.invalidate([("group", 1)])
+    assert cache.generation == generation + 1
+    # ответ, собранный до сброса, в кэш не попадает ни в одном процессе
+    cache.set(("a",), b"[1]", [("group", 1)], generation)
+    assert cache.get(("a",)) is None
+    cache.set(("a",), b"[1]", [("group", 1)], cache.generation)
+    assert cache.get(("a",)) is not None
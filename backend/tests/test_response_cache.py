@@ -0,0 +1,40 @@
+from cache import response_cache
+from database.db import Grade, SessionPeriod
+from tests.conftest import GROUP, TEACHER, STUDENTS, login, auth
+
+OTHER_GROUP_STUDENT = "Студент7 Имя0 Отчество2"
+
+
+def _grades(client, headers, etag=None):
+    if etag is not None:
+        headers = {**headers, "If-None-Match": etag}
+    return client.get("/student/my_grades", headers=headers)
+
+
+def test_grade_write_invalidates_only_affected_views(client):
+    student = auth(login(client, STUDENTS[0]))
+    other = auth(login(client, OTHER_GROUP_STUDENT))
+    first = _grades(client, student)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    other_etag = _grades(client, other).headers["ETag"]
+    assert _grades(client, student, etag).status_code == 304
+
+    current = (Grade
+               .select(Grade.grade)
+               .join(SessionPeriod)
+               .where((Grade.student == 1) & (Grade.discipline == 1) & (SessionPeriod.is_active == True))
+               .scalar())
+    new_grade = 2 if current != 2 else 3
+    response = client.patch(f"/teacher/mass-grades/{GROUP}", headers=auth(login(client, TEACHER)),
+                            json={"group_name": GROUP, "students": [STUDENTS[0]], "grades": [new_grade]})
+    assert response.status_code == 200, response.text
+
+    after = _grades(client, student, etag)
+    assert after.status_code == 200
+    assert after.headers["ETag"] != etag
+    assert new_grade in [row["Оценка"] for row in after.json() if row["Дисциплина"] == "Дисциплина 1"]
+    # ответ студента другой группы остался в кэше
+    hits = response_cache.hits
+    assert _grades(client, other, other_etag).status_code == 304
+    assert response_cache.hits == hits + 1
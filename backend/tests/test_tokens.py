@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from config import settings
+from database.db import User
+from services import token_revocation
+from tests.conftest import STUDENTS, login, auth
+
+
+def _change_password(client, tokens, password):
+    response = client.get("/student/edit-password", params={"password": password}, headers=auth(tokens))
+    assert response.status_code == 200, response.text
+
+
+def test_password_change_bumps_token_version(client, monkeypatch):
+    monkeypatch.setattr(settings, "principal_tokens", True)
+    tokens = login(client, STUDENTS[0])
+    version = User.get_by_id(4).token_version
+    assert client.get("/student/my_grades", headers=auth(tokens)).status_code == 200
+
+    _change_password(client, tokens, "456")
+    assert User.get_by_id(4).token_version == version + 1
+    # токен с прежней версией больше не принимается, новый вход — с новым паролем
+    response = client.get("/student/my_grades", headers=auth(tokens))
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Токен отозван"
+    assert client.post("/token", data={"username": STUDENTS[0], "password": "123"}).status_code == 401
+    assert client.get("/student/my_grades", headers=auth(login(client, STUDENTS[0], "456"))).status_code == 200
+
+
+def test_password_change_revokes_legacy_tokens(client):
+    # principal_tokens выключен: в токене только user_id и версия
+    tokens = login(client, STUDENTS[0])
+    headers = auth(tokens)
+    assert client.get("/student/my_grades", headers=headers).status_code == 200
+    assert client.get("/users/me/", headers=headers).status_code == 200
+
+    _change_password(client, tokens, "456")
+    for url in ("/student/my_grades", "/users/me/"):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 401
+        assert response.json()["detail"] == "Токен отозван"
+    assert client.get("/users/me/", headers=auth(login(client, STUDENTS[0], "456"))).status_code == 200
+
+
+def test_refresh_token_is_single_use(client):
+    tokens = login(client, STUDENTS[0])
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    assert client.get("/student/my_grades", headers=auth(response.json())).status_code == 200
+
+
+def test_refresh_token_replay_in_another_worker(client, monkeypatch):
+    tokens = login(client, STUDENTS[0])
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    # другой процесс: отзыв еще не подтянут sync(), в памяти пусто
+    monkeypatch.setattr(token_revocation.revoked_tokens, "_expires", dict())
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Токен отозван"
+
+
+def test_concurrent_refresh_issues_one_pair(client):
+    tokens = login(client, STUDENTS[0])
+    with ThreadPoolExecutor(4) as pool:
+        codes = list(pool.map(
+            lambda _: client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code,
+            range(4)))
+    assert sorted(codes) == [200, 401, 401, 401]
+
+
+def test_logout_revokes_access_and_refresh_tokens(client):
+    tokens = login(client, STUDENTS[0])
+    response = client.post("/logout", headers=auth(tokens), json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+    assert client.get("/student/my_grades", headers=auth(tokens)).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_password_change_revokes_refresh_token(client):
+    tokens = login(client, STUDENTS[0])
+    _change_password(client, tokens, "456")
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
@@ -0,0 +1,74 @@
+import io
+import pytest
+from cache import user_cache
+from database.db import write_atomic, on_commit, User, Grade, SessionPeriod
+from services import grade_import
+from tests.conftest import GROUP, TEACHER, STUDENTS, login, auth
+
+
+def _grade(student_id, discipline_id=1):
+    session_id = SessionPeriod.get(SessionPeriod.is_active == True).id
+    return Grade.get((Grade.student == student_id) & (Grade.discipline == discipline_id) &
+                     (Grade.session == session_id)).grade
+
+
+def test_on_commit_runs_after_commit(database):
+    calls = []
+    with write_atomic():
+        on_commit(lambda: calls.append("outer"))
+        with write_atomic():
+            on_commit(lambda: calls.append("inner"))
+        assert calls == []
+    assert calls == ["outer", "inner"]
+
+
+def test_rollback_drops_writes_and_hooks(database):
+    calls = []
+    before = _grade(1)
+    with pytest.raises(RuntimeError):
+        with write_atomic():
+            Grade.update(grade=2 if before != 2 else 3).where(Grade.student == 1).execute()
+            on_commit(lambda: calls.append("hook"))
+            raise RuntimeError
+    assert _grade(1) == before
+    assert calls == []
+
+
+def test_user_cache_invalidated_after_commit(database):
+    user = User.get_by_id(4)
+    user_cache.set(user.id, "old")
+    with write_atomic():
+        user.set_password("456")
+        user.save()
+        # до коммита другой запрос прочитал бы старую строку и снова положил ее в кэш
+        assert user_cache.get(user.id) == "old"
+    assert user_cache.get(user.id) is None
+
+
+def test_mass_grades_upsert_keeps_last_duplicate(client):
+    headers = auth(login(client, TEACHER))
+    count = Grade.select().count()
+    response = client.patch(f"/teacher/mass-grades/{GROUP}", headers=headers, json={
+        "group_name": GROUP,
+        "students": [STUDENTS[0], STUDENTS[1], STUDENTS[0]],
+        "grades": [2, 3, 5],
+    })
+    assert response.status_code == 200, response.text
+    # существующие оценки обновлены, новых строк нет
+    assert Grade.select().count() == count
+    assert _grade(1) == 5
+    assert _grade(2) == 3
+
+
+def test_import_upserts_existing_grades(database):
+    csv = ("student;group;discipline;session;grade\n"
+           f"{STUDENTS[0]};{GROUP};Дисциплина 1;Сессия 2;2\n"
+           f"{STUDENTS[0]};{GROUP};Дисциплина 1;Сессия 2;3\n"
+           f"{STUDENTS[1]};{GROUP};Дисциплина 9;Сессия 2;3\n")
+    count = Grade.select().count()
+    imported, errors = grade_import.import_grades(io.BytesIO(csv.encode()), 1)
+    assert imported == 2
+    assert [error["row"] for error in errors] == [4]
+    assert Grade.select().count() == count
+    # последняя строка файла для того же ключа
+    assert _grade(1) == 3